@@ -1,5 +1,7 @@
-import pickle
+import functools
+import os
 import re
+import tempfile
 
 import dash
 import dash_bootstrap_components as dbc
@@ -7,19 +9,46 @@ import dash_core_components as dcc
 import dash_cytoscape as cyto
 import dash_html_components as html
 import dash_table
-import pandas as pd
-import plotly.graph_objects as go
+import flask
+import numpy as np
 from dash.dependencies import Input, Output, State
+from scipy import sparse
 
 import app_text
 import color_gradient
 import cross_validation
 import diffusion
-from kinapp_helper import InputValidator
+import similarity
+from jobs import DONE, FAILED, RUNNING, JobQueue
+from kinapp_helper import get_input_validator, load_network_elements
+from result_cache import ResultCache, get_result_key
 
 # laod data and set some defaults:
-network = pickle.load(open("network/kinase_matrix.pkl", "rb"))
-pd.options.display.float_format = "{:,.2f}".format
+network = similarity.Network.load("network/kinase_network")
+network.load_aliases()  # also accept UniProt accessions and gene synonyms
+# cytoscape view of the whole network, prebuilt by "ggid.py build"
+network_elements_fp = "network/kinase_network/elements.json"
+network_version = network.get_version()
+# set GGID_RESULT_CACHE_DIR to share cached results between gunicorn workers
+result_cache = ResultCache(
+    max_size=int(os.environ.get("GGID_RESULT_CACHE_SIZE", 256)),
+    ttl=float(os.environ.get("GGID_RESULT_CACHE_TTL", 24 * 3600)),
+    cache_dir=os.environ.get("GGID_RESULT_CACHE_DIR"),
+)
+# LOO validation runs in background processes. Jobs are tracked in an SQLite
+# file shared by all gunicorn workers on the host, so any worker can answer
+# a poll; set GGID_JOB_DB to move it, or to "memory" for a single worker.
+job_db = os.environ.get(
+    "GGID_JOB_DB",
+    os.path.join(tempfile.gettempdir(), "ggid-jobs-%s.sqlite" % network_version),
+)
+job_queue = JobQueue(
+    max_workers=int(os.environ.get("GGID_JOB_WORKERS", 2)),
+    db_fp=None if job_db == "memory" else job_db,
+)
+# node color gradient; its hex lookup table is built once
+node_gradient = color_gradient.ColorGradientGenerator()
+node_gradient.create_color_map2(base_color=[255, 51, 51])
 cyto.load_extra_layouts()
 
 
@@ -27,12 +56,28 @@ cyto.load_extra_layouts()
 # diffusion and cytoscape logic:
 
 
+@functools.lru_cache(maxsize=None)
+def get_diffusion_operator():
+    """Returns diffusion operator of the network, built on first use."""
+    return diffusion.DiffusionOperator(network, use_kernel=True)
+
+
 def get_diffusion_result(labeled_kinases, zscore_cutoff):
     """Returns components of the diffusion results."""
-    experiment = diffusion.Diffusion(network, labeled_kinases)
+    key = get_result_key(network_version, labeled_kinases, False, zscore_cutoff)
+    result = result_cache.get(key)
+    if result is None:
+        result = compute_diffusion_result(labeled_kinases, zscore_cutoff)
+        result_cache.set(key, result)
+    return result
+
+
+def compute_diffusion_result(labeled_kinases, zscore_cutoff):
+    """Runs diffusion and builds its z-score table and graph."""
+    experiment = diffusion.Diffusion(network, labeled_kinases, get_diffusion_operator())
     result = experiment.diffuse()
-    # make z-score table
-    zscore_table = result.get_result_df_with_zscore()
+    # rank non-input proteins by z-score
+    zscore_table = result.get_ranked_result()
     # make updated graph
     graph_nodes, node_styling = create_cytoscape_div(
         network, labeled_kinases, zscore_table, zscore_cutoff
@@ -41,12 +86,55 @@ def get_diffusion_result(labeled_kinases, zscore_cutoff):
     return zscore_table, graph_nodes, node_styling
 
 
-def get_cross_validation_result(labeled_kinases, zscore_cutoff):
-    """Does LOO validation and returns container with formatted results."""
-    loo_experiment = cross_validation.LOOValitation(network, labeled_kinases)
-    zscore_table = loo_experiment.run_validation()
+def submit_cross_validation(labeled_kinases, zscore_cutoff):
+    """Starts LOO validation in the background, unless its result is cached.
+
+    Returns the job (its id, also the result cache key, and its inputs), for
+    polling with poll_cross_validation. Repeated submissions share one job.
+    """
+    key = get_result_key(network_version, labeled_kinases, True, zscore_cutoff)
+    if result_cache.get(key) is None:
+        job_queue.submit(
+            key, compute_cross_validation_result, labeled_kinases, zscore_cutoff
+        )
+    return {"id": key, "kinases": labeled_kinases, "zscore_cutoff": zscore_cutoff}
+
+
+def poll_cross_validation(job):
+    """Returns job state and, once done, its result.
+
+    A job that is not known (ex: tracked in memory by another gunicorn
+    worker, or expired) and whose result is not cached is resubmitted.
+
+    Returns
+    -------
+    status : str
+        DONE, RUNNING or FAILED (see jobs module)
+    elapsed : float
+        seconds since the job was submitted
+    result : tuple, None
+        output of compute_cross_validation_result, if done
+    """
+    status, elapsed = job_queue.get_status(job["id"])
+    if status == DONE:
+        result = job_queue.get_result(job["id"])
+        result_cache.set(job["id"], result)
+        return DONE, elapsed, result
+    if status in (RUNNING, FAILED):
+        return status, elapsed, None
+    # unknown job, since the result was cached when submitted, or the job
+    # is tracked by another worker or expired
+    result = result_cache.get(job["id"])
+    if result is not None:
+        return DONE, elapsed, result
+    submit_cross_validation(job["kinases"], job["zscore_cutoff"])
+    return RUNNING, elapsed, None
+
+
+def get_cross_validation_result(result):
+    """Formats LOO validation result and returns container with it."""
+    zscore_table, (tpr, fpr, auc), graph_nodes, node_styling = result
     # get ROC figure
-    tpr, fpr, auc = loo_experiment.get_roc()
     roc_fig = draw_roc_curve(tpr, fpr, auc)
     # define results div
     result_div = html.Div(
@@ -74,20 +162,30 @@ def get_cross_validation_result(labeled_kinases, zscore_cutoff):
             ),
         ]
     )
+    return result_div, graph_nodes, node_styling
+
+
+def compute_cross_validation_result(labeled_kinases, zscore_cutoff):
+    """Runs LOO validation and builds its z-score table, ROC and graph."""
+    loo_experiment = cross_validation.LOOValitation(
+        network, labeled_kinases, get_diffusion_operator()
+    )
+    zscore_table = loo_experiment.run_validation()
+    roc = loo_experiment.get_roc()
     # make updated graph
     graph_nodes, node_styling = create_cytoscape_div(
         network, labeled_kinases, zscore_table, zscore_cutoff
     )
-    return result_div, graph_nodes, node_styling
+    return zscore_table, roc, graph_nodes, node_styling
 
 
 def convert_to_dash_table(zscore_table):
-    """Converts pandas zscore table to Dash data table."""
+    """Converts ranked diffusion result to Dash data table."""
 
     dash_table_ = dash_table.DataTable(
         id="hi",
-        columns=[{"name": i, "id": i} for i in zscore_table.columns],
-        data=zscore_table.to_dict("records"),
+        columns=[{"name": i, "id": i} for i in zscore_table.get_columns()],
+        data=zscore_table.to_records(),
         export_columns="all",
         export_format="csv",
         page_size=20,
@@ -97,6 +195,8 @@ def convert_to_dash_table(zscore_table):
 
 def draw_roc_curve(tpr, fpr, auc):
     """Creates plotly scatter for the ROC curve."""
+    import plotly.graph_objects as go  # slow to import, and only needed here
+
     fig = go.Figure()
     loo_trace = go.Scatter(
         x=fpr, y=tpr, mode="lines", line_color="red", name="input set (AUC=%1.2f)" % auc
@@ -127,63 +227,36 @@ def draw_roc_curve(tpr, fpr, auc):
     return fig
 
 
-def get_network_elements(network):
-    """Constructs cytoscape view of the entire network."""
-    # add all proteins and their edges to the view
-    elements = []
-    protein_name = network.proteins
-    nodes_i, nodes_j = network.network.nonzero()
-    # iterate over all edges
-    for index, node_i_index in enumerate(nodes_i):
-        node_j_index = nodes_j[index]
-        # get protein names that make up the edge
-        node_i_name = protein_name[node_i_index]
-        node_j_name = protein_name[node_j_index]
-        # construct cytoscape elements
-        element_i = {"data": {"id": node_i_name, "label": node_i_name}}
-        element_j = {"data": {"id": node_j_name, "label": node_j_name}}
-        edge_ij = {"data": {"source": node_i_name, "target": node_j_name}}
-        edge_ji = {"data": {"source": node_j_name, "target": node_i_name}}
-        # the matrix is symmetrical, so we need to account for redundant edges
-        if element_i not in elements:
-            elements.append(element_i)
-        if element_j not in elements:
-            elements.append(element_j)
-        if (edge_ij not in elements) and (edge_ji not in elements):
-            elements.append(edge_ij)
-    return elements
-
-
 def get_cluster_elements(network, input_proteins, top_hits, diffusion_result):
     """Constructs cytoscape view for the post-diffusion result."""
     # The goal is to make a graph view of the input proteins and
     # their most closely connected post-diffusion hits. (Together,
     # these form a cluster.) We only want to display the cluster
     # proteins and the connections they form to each other.
-    elements = []
-    cluster = input_proteins + top_hits
-    # find connections within cluster
-    for protein in cluster:
-        edges = network.get_edges_for_protein(protein)
-        cluster_edges = [edge for edge in edges if edge in cluster]
-        for edge in cluster_edges:
-            edge_ij = {"data": {"source": protein, "target": edge}}
-            edge_ji = {
-                "data": {"source": edge, "target": protein}
-            }  # no redundant edges
-            if (edge_ij not in elements) and (edge_ji not in elements):
-                elements.append(edge_ij)
+    # drop repeats (in LOO, input proteins can also be top hits)
+    cluster = list(dict.fromkeys(input_proteins + top_hits))
+    cluster_indices = network.indices_for(cluster)
+    # find connections within cluster: slice the cluster's subgraph, and
+    # read each edge once from its upper triangle
+    subgraph = network.network[cluster_indices][:, cluster_indices]
+    subgraph = sparse.triu(subgraph + subgraph.T, k=1).tocoo()
+    elements = [
+        {"data": {"source": cluster[i], "target": cluster[j]}}
+        for i, j in zip(subgraph.row.tolist(), subgraph.col.tolist())
+    ]
     # now add nodes to the view, and attach experimental data to the nodes
-    zscores = dict(zip(diffusion_result.protein, diffusion_result.zscore))
-    ranks = dict(zip(diffusion_result.protein, diffusion_result["rank"]))
+    proteins = diffusion_result.proteins.tolist()
+    zscores = dict(zip(proteins, diffusion_result.zscore.tolist()))
+    ranks = dict(zip(proteins, diffusion_result.rank.tolist()))
+    input_proteins = set(input_proteins)
     for node in cluster:
         node_notation = {
             "data": {
                 "id": node,
                 "label": node,
                 "input_label_flag": 0 if node not in input_proteins else 1,
-                "zscore": None if node not in zscores else zscores[node],
-                "rank": None if node not in ranks else ranks[node],
+                "zscore": zscores.get(node),
+                "rank": ranks.get(node),
             }
         }
         elements.append(node_notation)
@@ -194,8 +267,8 @@ def create_cytoscape_div(network, labels, diffusion_result, zscore_cutoff):
     """Constructs updated cytoscape div."""
     # regardless of experiment type, we want to show all label nodes
     # plus all the top-scoring unlabeled nodes
-    top_hits = diffusion_result[diffusion_result.zscore >= zscore_cutoff]
-    top_hits_nodes = list(top_hits.protein.values)
+    top_hits = diffusion_result.get_top_hits(zscore_cutoff)
+    top_hits_nodes = diffusion_result.proteins[top_hits].tolist()
     graph_elements = get_cluster_elements(
         network, labels, top_hits_nodes, diffusion_result
     )
@@ -203,17 +276,18 @@ def create_cytoscape_div(network, labels, diffusion_result, zscore_cutoff):
     # based on experiment type (if it's LOO we want gradient applied to labels too)
     is_loo = len(network.proteins) == len(diffusion_result)
     if is_loo:
-        labels_result = diffusion_result[diffusion_result.initial_state == 1]
-        top_hits_and_labels = pd.concat([top_hits, labels_result])
+        top_hits_and_labels = top_hits | (diffusion_result.initial_state == 1)
         # to get an even gradient, rerank within the set
-        top_hits_and_labels["rank"] = top_hits_and_labels["rank"].rank()
-        graph_style = get_cyto_stylesheet(top_hits_and_labels, is_loo)
+        ranks = diffusion.get_ranks(diffusion_result.rank[top_hits_and_labels])
+        proteins = diffusion_result.proteins[top_hits_and_labels]
     else:
-        graph_style = get_cyto_stylesheet(top_hits, is_loo)
+        ranks = diffusion_result.rank[top_hits]
+        proteins = diffusion_result.proteins[top_hits]
+    graph_style = get_cyto_stylesheet(proteins, ranks, is_loo)
     return graph_elements, graph_style
 
 
-def get_cyto_stylesheet(diffusion_result, is_loo):
+def get_cyto_stylesheet(proteins, ranks, is_loo):
     """Style nodes according to post-diffusion results."""
     stylesheet = [
         {"selector": "node", "style": {"label": "data(label)"}},
@@ -234,7 +308,7 @@ def get_cyto_stylesheet(diffusion_result, is_loo):
     ]
     # color nodes according to their post-diffusion z-score
     # this will overwrite default white of labels in a loo experiment
-    protein_colors = get_colors(diffusion_result)
+    protein_colors = get_colors(proteins, ranks)
     color_selectors = make_selector_colors(protein_colors)
     return stylesheet + color_selectors
 
@@ -251,17 +325,10 @@ def make_selector_colors(protein_colors):
     return selectors
 
 
-def get_colors(diffusion_result):
+def get_colors(proteins, ranks):
     """Generate color gradient for displayed nodes."""
-    xcolor_gradient = color_gradient.ColorGradientGenerator()
-    xcolor_gradient.create_color_map2(base_color=[255, 51, 51])
-    colors = xcolor_gradient.map_colors(
-        1 - diffusion_result["rank"] / len(diffusion_result)
-    )
-    color_dict = dict(zip(diffusion_result.protein, colors))
-    print(diffusion_result)
-    print(diffusion_result["rank"])
-    print(color_dict)
+    colors = node_gradient.map_colors(1 - np.asarray(ranks) / max(len(ranks), 1))
+    color_dict = dict(zip(proteins.tolist(), colors))
     return color_dict
 
 
@@ -366,7 +433,7 @@ def get_main_tab():
                         "width": "1000px",
                     },
                     zoom=0.1,
-                    elements=get_network_elements(network),
+                    elements=load_network_elements(network, network_elements_fp),
                     pan={"x": 500, "y": 300},
                 ),
             ],
@@ -391,6 +458,11 @@ def get_main_tab():
         dcc.RadioItems(
             id="diffusion-switch", value="invalid", style={"display": "none"}
         ),
+        # validated kinases (HUGO symbols), passed from validation to diffusion
+        dcc.Store(id="valid-kinases"),
+        # id of the background LOO validation job, and its poll timer
+        dcc.Store(id="loo-job"),
+        dcc.Interval(id="loo-job-poll", interval=1000, disabled=True),
     ]
 
 
@@ -460,6 +532,13 @@ app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
 server = app.server
 app.title = "GGid"
 
+
+@server.route("/stats")
+def get_stats():
+    """Reports result cache use; hits and misses are counted per worker."""
+    return flask.jsonify(dict(result_cache.get_stats(), worker_pid=os.getpid()))
+
+
 tab_main = dbc.Tab(label="Diffusion Tool", children=get_main_tab())
 tab_theory = dbc.Tab(label="Theory", children=get_theory_tab())
 tab_example = dbc.Tab(label="Example", children=get_example_tab())
@@ -519,6 +598,7 @@ def display_tapped_node_data(data, diffusion_switch):
     [
         Output("status-line", "children"),
         Output("diffusion-switch", "value"),
+        Output("valid-kinases", "data"),
     ],
     [Input("submit-button", "n_clicks")],
     [State("input-kinase-list", "value")],
@@ -536,23 +616,29 @@ def validate_inputs(n_clicks, protein_list):
         message.append(
             dbc.Alert("You haven't entered anything in the textbox", color="danger")
         )
-        return message, diffusion_switch
+        return message, diffusion_switch, dash.no_update
     else:
-        valid_kinases = InputValidator().validate(proteins)
-        valid_kinases = [vk for vk in valid_kinases if vk in network.proteins]
-        invalid_kinases = [kinase for kinase in proteins if kinase not in valid_kinases]
+        # map inputs to HUGO symbols (accepts synonyms and uniprot ids too)
+        resolved = get_input_validator().resolve(proteins)
+        resolved = {
+            protein: hugo
+            for protein, hugo in resolved.items()
+            if network.has_protein(hugo)
+        }
+        valid_kinases = list(dict.fromkeys(resolved.values()))
+        invalid_kinases = [kinase for kinase in proteins if kinase not in resolved]
         if len(valid_kinases) == 0:
             message.append(
                 dbc.Alert(
                     """
                     None of the strings you entered were recognized as valid kinase ids.
-                    The app expects HUGO (hgnc) symbols for human kinases.
+                    The app expects HUGO (hgnc) symbols or UniProt ids for human kinases.
                     See list here https://www.genenames.org/
                     """,
                     color="danger",
                 )
             )
-            return message, diffusion_switch
+            return message, diffusion_switch, dash.no_update
         if len(valid_kinases) > 0:
             message.append(
                 dbc.Alert(
@@ -593,7 +679,7 @@ def validate_inputs(n_clicks, protein_list):
             html.Div(children=message),
         ]
     )
-    return message_wrap, diffusion_switch
+    return message_wrap, diffusion_switch, valid_kinases
 
 
 @app.callback(
@@ -603,42 +689,84 @@ def validate_inputs(n_clicks, protein_list):
         Output("kin-map", "stylesheet"),  # 'stylesheet' is different from 'style'
         Output("network-layout-toggle", "options"),
         Output("node-info-wrapper", "style"),
+        Output("loo-job", "data"),
+        Output("loo-job-poll", "disabled"),
     ],
-    [Input("diffusion-switch", "value")],
+    [Input("diffusion-switch", "value"), Input("loo-job-poll", "n_intervals")],
     [
-        State("input-kinase-list", "value"),
+        State("valid-kinases", "data"),
         State("loo-switch", "value"),
         State("zscore-cutoff", "value"),
+        State("loo-job", "data"),
     ],
     prevent_initial_call=True,
 )
-def diffuse(diffusion_switch, protein_list, loo_switch, zscore_cutoff):
+def diffuse(
+    diffusion_switch, n_intervals, valid_kinases, loo_switch, zscore_cutoff, loo_job
+):
     """Conducts diffusion experiment with input kinases."""
-    proteins = re.findall("\w+", protein_list)
-    # have to validate again -- I am not good at passing data b/w callbacks
-    valid_kinases = InputValidator().validate(proteins)
-    valid_kinases = [vk for vk in valid_kinases if vk in network.proteins]
+    triggers = [trigger["prop_id"] for trigger in dash.callback_context.triggered]
+    if "loo-job-poll.n_intervals" in triggers:
+        # a background LOO validation was submitted earlier; check on it
+        return get_cross_validation_outputs(loo_job)
+    # kinases were resolved to network proteins by validate_inputs
     if "on" in loo_switch and len(valid_kinases) >= 2:
-        # averaged post-diffusion results produced via LOO validation
-        result_div, graph_nodes, node_styling = get_cross_validation_result(
-            valid_kinases, zscore_cutoff
-        )
-    else:
-        # plain diffusion, with no LOO validation
-        zscore_table, graph_nodes, node_styling = get_diffusion_result(
-            valid_kinases, zscore_cutoff
+        # averaged post-diffusion results produced via LOO validation,
+        # which can be slow, so it runs in the background
+        loo_job = submit_cross_validation(valid_kinases, zscore_cutoff)
+        return get_cross_validation_outputs(loo_job)
+    # plain diffusion, with no LOO validation
+    zscore_table, graph_nodes, node_styling = get_diffusion_result(
+        valid_kinases, zscore_cutoff
+    )
+    result_div = (
+        html.Details(
+            children=[
+                html.Summary("Full z-score and ranks table (expand for details)"),
+                convert_to_dash_table(zscore_table),
+            ]
+        ),
+    )
+    graph_options = get_graph_layout_options(isdisabled=False)
+    node_info_style = {}  # this div is hidden prior to diffusion
+    return (
+        result_div,
+        graph_nodes,
+        node_styling,
+        graph_options,
+        node_info_style,
+        None,
+        True,  # no job to poll
+    )
+
+
+def get_cross_validation_outputs(job):
+    """Returns diffuse callback outputs for a background LOO validation."""
+    status, elapsed, result = poll_cross_validation(job)
+    if status == RUNNING:
+        message = dbc.Alert(
+            "Cross-validation is running (%d s)..." % elapsed, color="secondary"
         )
-        result_div = (
-            html.Details(
-                children=[
-                    html.Summary("Full z-score and ranks table (expand for details)"),
-                    convert_to_dash_table(zscore_table),
-                ]
-            ),
+        no_update = [dash.no_update] * 4
+        return [message] + no_update + [job, False]  # keep polling
+    if status == FAILED:
+        message = dbc.Alert(
+            "Cross-validation failed, please resubmit the kinase set.",
+            color="danger",
         )
+        return [message] + [dash.no_update] * 4 + [None, True]
+    result_div, graph_nodes, node_styling = get_cross_validation_result(result)
     graph_options = get_graph_layout_options(isdisabled=False)
     node_info_style = {}  # this div is hidden prior to diffusion
-    return result_div, graph_nodes, node_styling, graph_options, node_info_style
+    return (
+        result_div,
+        graph_nodes,
+        node_styling,
+        graph_options,
+        node_info_style,
+        None,
+        True,  # done, stop polling
+    )
 
 
 @app.callback(
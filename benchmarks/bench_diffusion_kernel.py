@@ -0,0 +1,62 @@
+"""Compares kernel-mode and solver-mode diffusion across input set sizes.
+
+Usage (from the repo root):
+
+    $ python benchmarks/bench_diffusion_kernel.py
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import diffusion  # noqa: E402
+import similarity  # noqa: E402
+
+NETWORK_DIR = "network/kinase_network"
+INPUT_SET_SIZES = [1, 2, 5, 10, 25, 50, 100]
+REPEATS = 200
+
+
+def time_queries(network, operator, input_size, rng):
+    """Returns mean wall time (ms) of a diffusion query of given input size."""
+    input_sets = [
+        list(rng.choice(network.proteins, size=input_size, replace=False))
+        for _ in range(REPEATS)
+    ]
+    t0 = time.perf_counter()
+    for input_nodes in input_sets:
+        diffusion.Diffusion(network, input_nodes, operator).diffuse()
+    return (time.perf_counter() - t0) / REPEATS * 1000
+
+
+def main():
+    """Runs the benchmark and prints a timing table."""
+    network = similarity.Network.load(NETWORK_DIR)
+    rng = np.random.default_rng(0)
+
+    t0 = time.perf_counter()
+    solver = diffusion.DiffusionOperator(network)
+    solver_setup = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    kernel = diffusion.DiffusionOperator(network, use_kernel=True)
+    kernel_setup = time.perf_counter() - t0
+
+    print("network size: %d proteins" % len(network.proteins))
+    print(
+        "setup: solver %.1f ms, kernel %.1f ms"
+        % (solver_setup * 1000, kernel_setup * 1000)
+    )
+    print("%10s %12s %12s" % ("input size", "solver (ms)", "kernel (ms)"))
+    for input_size in INPUT_SET_SIZES:
+        if input_size > len(network.proteins):
+            break
+        solver_ms = time_queries(network, solver, input_size, rng)
+        kernel_ms = time_queries(network, kernel, input_size, rng)
+        print("%10d %12.3f %12.3f" % (input_size, solver_ms, kernel_ms))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Times sparse network construction and diffusion at increasing network sizes.
+
+The similarity matrices are synthetic: each protein gets a fixed number of
+random nonzero similarity scores, mimicking the upper-triangle COO matrix
+produced by similarity.Calculator.
+
+Usage (from the repo root):
+
+    $ python benchmarks/bench_network_scaling.py
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from scipy import sparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import diffusion  # noqa: E402
+import similarity  # noqa: E402
+
+NETWORK_SIZES = [500, 5000, 20000]
+SCORES_PER_PROTEIN = 200
+EDGES_PER_PROTEIN = 5
+
+
+def make_similarity_matrix(size, rng):
+    """Creates random upper-triangle similarity matrix of given size."""
+    rows = np.repeat(np.arange(size), SCORES_PER_PROTEIN)
+    cols = rng.integers(0, size, len(rows))
+    upper = rows < cols
+    scores = rng.random(upper.sum())
+    return sparse.coo_matrix((scores, (rows[upper], cols[upper])), shape=(size, size))
+
+
+def run_stage(name, func, timings):
+    """Runs func, records its wall time (s) and peak traced memory (MB)."""
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    output = func()
+    wall_time = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    timings.append((name, wall_time, peak / 1e6))
+    return output
+
+
+def main():
+    """Runs the benchmark and prints a table per network size."""
+    rng = np.random.default_rng(0)
+    for size in NETWORK_SIZES:
+        protein_similarity = make_similarity_matrix(size, rng)
+        proteins = ["P%d" % i for i in range(size)]
+        timings = []
+        network = run_stage(
+            "init", lambda: similarity.Network(protein_similarity, proteins), timings
+        )
+        run_stage(
+            "threshold", lambda: network.threshold_matrix(EDGES_PER_PROTEIN), timings
+        )
+        run_stage("symmetry", network.enforce_network_symmetry, timings)
+        operator = run_stage(
+            "operator", lambda: diffusion.DiffusionOperator(network), timings
+        )
+        run_stage(
+            "diffuse",
+            lambda: diffusion.Diffusion(network, proteins[:10], operator).diffuse(),
+            timings,
+        )
+        print("network size: %d proteins, %d edges" % (size, network.network.nnz))
+        for name, wall_time, peak_mb in timings:
+            print("  %-10s %10.3f s %10.1f MB" % (name, wall_time, peak_mb))
+
+
+if __name__ == "__main__":
+    main()
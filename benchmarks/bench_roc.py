@@ -0,0 +1,71 @@
+"""Times cross_validation.roc_curve and checks it against sklearn.
+
+The parity check runs only if scikit-learn is installed; the app itself
+does not need it.
+
+Usage (from the repo root):
+
+    $ python benchmarks/bench_roc.py
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import cross_validation  # noqa: E402
+
+REPEATS = 1000
+TRIALS = 500
+
+
+def get_random_case(rng):
+    """Returns random labels and scores, often with tied scores."""
+    size = rng.integers(2, 600)
+    y_true = rng.integers(0, 2, size)
+    y_true[rng.integers(size)] = 1  # at least one of each class
+    y_true[rng.integers(size)] = 0
+    if rng.random() < 0.5:
+        y_score = rng.integers(0, rng.integers(1, 20), size).astype(float)
+    else:
+        y_score = rng.random(size)
+    return y_true, y_score
+
+
+def check_parity(rng):
+    """Compares ROC curves and AUCs with sklearn on random cases."""
+    try:
+        import sklearn.metrics
+    except ImportError:
+        print("sklearn not installed, skipping parity check")
+        return
+    for _ in range(TRIALS):
+        y_true, y_score = get_random_case(rng)
+        fpr, tpr, thresholds = cross_validation.roc_curve(y_true, y_score)
+        sk_fpr, sk_tpr, sk_thresholds = sklearn.metrics.roc_curve(y_true, y_score)
+        # older sklearn versions start thresholds with max score + 1, not inf
+        assert np.allclose(fpr, sk_fpr) and np.allclose(tpr, sk_tpr)
+        assert np.allclose(thresholds[1:], sk_thresholds[1:])
+        auc = cross_validation.get_auc(fpr, tpr)
+        assert np.isclose(auc, sklearn.metrics.roc_auc_score(y_true, y_score))
+    print("parity with sklearn: ok (%d random cases)" % TRIALS)
+
+
+def main():
+    """Runs the parity check and prints the timing."""
+    rng = np.random.default_rng(0)
+    check_parity(rng)
+    y_true = (rng.random(500) < 0.05).astype(int)
+    y_score = rng.random(500)
+    t0 = time.perf_counter()
+    for _ in range(REPEATS):
+        fpr, tpr, _ = cross_validation.roc_curve(y_true, y_score)
+        cross_validation.get_auc(fpr, tpr)
+    elapsed = (time.perf_counter() - t0) / REPEATS * 1e6
+    print("roc_curve + get_auc on 500 scores: %.1f us" % elapsed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Profiles app startup with ``python -X importtime``.
+
+Imports a module in a fresh interpreter, then prints the total import time,
+the slowest imports and which of the heavy, deferred libraries were loaded.
+
+Usage (from the repo root):
+
+    $ python benchmarks/bench_startup.py                  # the app
+    $ python benchmarks/bench_startup.py similarity 20    # module, top n
+"""
+
+import subprocess
+import sys
+import time
+
+# libraries that the app should only import when a request needs them; plotly
+# itself is always loaded by dash, the deferred part is plotly.graph_objects
+DEFERRED_MODULES = [
+    "pandas",
+    "sklearn",
+    "matplotlib",
+    "plotly.graph_objects",
+    "scipy.stats",
+]
+
+
+def profile_import(module):
+    """Imports module in a new interpreter and parses its import times.
+
+    Returns
+    -------
+    wall_time : float
+        seconds until the interpreter exited
+    import_times : dict
+        maps each imported module to its cumulative import time (s)
+    """
+    t0 = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import %s" % module],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,  # capture_output and text need Python 3.7
+    )
+    wall_time = time.perf_counter() - t0
+    if completed.returncode != 0:
+        sys.exit(completed.stderr.splitlines()[-1])
+    import_times = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        import_times[name.strip()] = int(cumulative) / 1e6
+    return wall_time, import_times
+
+
+def main():
+    """Runs the profile and prints a report."""
+    module = sys.argv[1] if len(sys.argv) > 1 else "application"
+    top_n = int(sys.argv[2]) if len(sys.argv) > 2 else 15
+    wall_time, import_times = profile_import(module)
+    print(
+        "import %s: %.2f s wall, %.2f s importing"
+        % (module, wall_time, import_times.get(module, float("nan")))
+    )
+    print("\nslowest imports (cumulative):")
+    slowest = sorted(import_times.items(), key=lambda item: -item[1])
+    for name, seconds in slowest[:top_n]:
+        print("  %8.3f s  %s" % (seconds, name))
+    print("\ndeferred libraries loaded at startup:")
+    for name in DEFERRED_MODULES:
+        loaded = name in import_times
+        print("  %-20s %s" % (name, "YES" if loaded else "no"))
+
+
+if __name__ == "__main__":
+    main()
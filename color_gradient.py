@@ -1,13 +1,17 @@
 """Generates color gradient for nodes based on diffusion z-score."""
 
 
-import matplotlib.cm
-import matplotlib.colors
+import functools
+
 import numpy as np
 
 
 class ColorGradientGenerator:
-    """Generates color gradient."""
+    """Generates color gradient.
+
+    The gradient is a lookup table of hex colors, built once per palette
+    and shared by all generators; scores are mapped to colors by bucketing.
+    """
 
     def __init__(self, lower_bound=0, upper_bound=10):
         """Inits class with lower and upper bound for gradient."""
@@ -19,23 +23,55 @@ class ColorGradientGenerator:
         """Sets colormap."""
 
         num_bins = 10
-        color_map = matplotlib.cm.get_cmap(palette, num_bins)
-        self.scalar_map = matplotlib.cm.ScalarMappable(cmap=color_map)
+        self.hex_colors = _get_palette_colors(palette, num_bins)
 
     def create_color_map2(self, base_color=None):
         if not base_color:
             base_color = [255, 0, 0]  # red
-        N = 256
-        vals = np.ones((N, 4))
-        vals[:, 0] = np.linspace(1, base_color[0] / 256, N)
-        vals[:, 1] = np.linspace(1, base_color[1] / 256, N)
-        vals[:, 2] = np.linspace(1, base_color[2] / 256, N)
-        color_map = matplotlib.colors.ListedColormap(vals)
-        self.scalar_map = matplotlib.cm.ScalarMappable(cmap=color_map)
+        self.hex_colors = _get_gradient_colors(tuple(base_color))
 
     def map_colors(self, scores):
-        """Maps scores to colors in gradient."""
+        """Maps scores to colors in gradient.
+
+        Scores are scaled to the [0, 1] range first, so the lowest score
+        gets the first color and the highest gets the last one.
+        """
 
-        rgba_colors = self.scalar_map.to_rgba(scores)
-        hex_colors = [matplotlib.colors.to_hex(clr) for clr in rgba_colors]
+        scores = np.asarray(scores, dtype=float)
+        if len(scores) == 0:
+            return []
+        score_range = scores.max() - scores.min()
+        if score_range > 0:
+            scores = (scores - scores.min()) / score_range
+        else:
+            scores = np.zeros(len(scores))
+        num_colors = len(self.hex_colors)
+        buckets = np.minimum((scores * num_colors).astype(int), num_colors - 1)
+        hex_colors = self.hex_colors[buckets].tolist()
         return hex_colors
+
+
+@functools.lru_cache(maxsize=None)
+def _get_gradient_colors(base_color):
+    """Returns 256 hex colors fading from white to base color."""
+    num_colors = 256
+    rgb = np.ones((num_colors, 3))
+    for channel in range(3):
+        rgb[:, channel] = np.linspace(1, base_color[channel] / 256, num_colors)
+    return _to_hex(rgb)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_palette_colors(palette, num_bins):
+    """Returns hex colors of a binned matplotlib palette."""
+    import matplotlib.cm  # only needed for named palettes
+
+    color_map = matplotlib.cm.get_cmap(palette, num_bins)
+    return _to_hex(color_map(np.arange(num_bins))[:, :3])
+
+
+def _to_hex(rgb):
+    """Converts n x 3 array of RGB values in [0, 1] to hex color strings."""
+    rgb = np.round(rgb * 255).astype(int)
+    hex_colors = np.array(["#%02x%02x%02x" % tuple(color) for color in rgb])
+    return hex_colors
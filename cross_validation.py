@@ -4,15 +4,12 @@ Usage:
 
     loo_experiment = LOOValidation(network, input_nodes)
     result = loo_experiment.run_validation()
-    print(result.head())
+    print(result.to_df().head())
     tpr, fpr, auc = loo_experiment.get_roc()
 
 """
 
 import numpy as np
-import pandas as pd
-import scipy.stats
-import sklearn.metrics
 
 import diffusion
 
@@ -20,69 +17,106 @@ import diffusion
 class LOOValitation:
     """Diffusion leave-one-out cross validation experiment."""
 
-    def __init__(self, network, input_nodes):
+    def __init__(self, network, input_nodes, operator=None):
         """Inits validation experiment with network and input nodes."""
         self.network = network
         self.input_nodes = input_nodes
         if len(self.input_nodes) < 2:
             raise ValueError("need at least 2 input nodes for cross-validation")
+        if operator is None:
+            operator = diffusion.DiffusionOperator(network)
+        self.operator = operator
         self.result = None
 
     def run_validation(self):
         """Runs Leave-One-Out cross-validation with the input set."""
-        left_out_score = {}
-        post_diffusion_scores = []
-        for left_out in self.input_nodes:
-            input_sans_one = [i for i in self.input_nodes if i != left_out]
-            dif = diffusion.Diffusion(self.network, input_sans_one)
-            dif_result = dif.diffuse()
-            post_diffusion_scores.append(dif_result.final_state)
-            left_out_score[left_out] = dif_result.get_result_for_protein(left_out)
-        avg_scores = self.average_results(post_diffusion_scores)
-        result = self.format_result_as_pd_df(avg_scores, self.network.proteins)
-        result = self.insert_leftout_scores(result, left_out_score)
-        # preset post-diffusion scores as zscores and ranks
-        result["zscore"] = scipy.stats.zscore(result.final_state)
-        result["rank"] = result.zscore.rank(ascending=False)
-        result.sort_values(by="zscore", ascending=False, inplace=True)
+        # Diffusion is linear, so diffusing the input set minus one node is
+        # the sum of the single-node diffusions of the remaining nodes.
+        # Solve all single-node diffusions in one batch, then derive each
+        # leave-one-out result by subtracting the left-out column.
+        # use network names, so that aliases of one protein count once
+        input_indices = self.network.indices_for(self.input_nodes)
+        input_nodes = list(dict.fromkeys(self.network.names_for(input_indices)))
+        dif = diffusion.Diffusion(self.network, input_nodes, self.operator)
+        single_node_states = dif.diffuse_each()
+        all_nodes_state = single_node_states.sum(axis=1, keepdims=True)
+        post_diffusion_scores = (all_nodes_state - single_node_states).T
+        input_indices = dif.get_node_indices(input_nodes)
+        left_out_scores = post_diffusion_scores[
+            np.arange(len(input_nodes)), input_indices
+        ]
+        final_state = self.average_results(post_diffusion_scores)
+        final_state[input_indices] = left_out_scores
+        initial_state = np.zeros(len(final_state), dtype=int)
+        initial_state[input_indices] = 1
+        # z-scores and ranks cover input proteins too, via left-out scores
+        result = diffusion.RankedResult(
+            self.network.proteins, initial_state, final_state
+        )
         self.result = result
         return result
 
     @staticmethod
     def average_results(score_vectors):
         """Averages results of several diffusion experiments."""
-        agg = score_vectors[0]
-        for result in score_vectors[1:]:
-            agg = np.add(agg, result)
-        avg = agg / len(score_vectors)
-        return avg
-
-    @staticmethod
-    def format_result_as_pd_df(avg_scores, proteins):
-        """Converts result vector into pandas data frame with protein names column."""
-        result = pd.DataFrame(
-            {
-                "protein": proteins,
-                "initial_state": [0] * len(proteins),
-                "final_state": avg_scores,
-            }
-        )
-        return result
-
-    @staticmethod
-    def insert_leftout_scores(result, left_out_score):
-        """Insert left-out scores into final result table."""
-        for protein, score in left_out_score.items():
-            result.loc[result.protein == protein, "final_state"] = score
-            result.loc[result.protein == protein, "initial_state"] = 1
-        return result
+        return np.mean(np.asarray(score_vectors), axis=0)
 
     def get_roc(self):
         """Calculate ROC."""
         class_labels = self.result.initial_state
         pred_scores = self.result.final_state
-        fpr, tpr, _ = sklearn.metrics.roc_curve(
-            y_true=class_labels, y_score=pred_scores, pos_label=1
-        )
-        auc = sklearn.metrics.auc(fpr, tpr)
+        fpr, tpr, _ = roc_curve(y_true=class_labels, y_score=pred_scores)
+        auc = get_auc(fpr, tpr)
         return [tpr, fpr, auc]
+
+
+def roc_curve(y_true, y_score):
+    """Computes ROC curve of binary labels (1 = positive) and their scores.
+
+    Same output as sklearn.metrics.roc_curve (with drop_intermediate=True):
+    tied scores form a single point, and points on a straight segment of
+    the curve are dropped.
+
+    Parameters
+    ----------
+    y_true : numpy array
+        1 for positive samples, 0 for negative ones
+    y_score : numpy array
+        scores, higher meaning more likely positive
+
+    Returns
+    -------
+    fpr : numpy array
+        false positive rate at each threshold
+    tpr : numpy array
+        true positive rate at each threshold
+    thresholds : numpy array
+        decreasing score thresholds, starting with inf
+    """
+    y_true = np.asarray(y_true) == 1
+    y_score = np.asarray(y_score)
+    order = np.argsort(y_score, kind="mergesort")[::-1]
+    y_score = y_score[order]
+    y_true = y_true[order]
+    # the last sample of each run of tied scores is a threshold
+    threshold_indices = np.append(np.flatnonzero(np.diff(y_score)), len(y_score) - 1)
+    tps = np.cumsum(y_true)[threshold_indices]
+    fps = 1 + threshold_indices - tps
+    thresholds = y_score[threshold_indices]
+    if len(fps) > 2:
+        # keep only the corners of the curve
+        is_corner = np.logical_or(np.diff(fps, 2), np.diff(tps, 2))
+        kept = np.flatnonzero(np.concatenate(([True], is_corner, [True])))
+        tps, fps, thresholds = tps[kept], fps[kept], thresholds[kept]
+    tps = np.append(0, tps)
+    fps = np.append(0, fps)
+    thresholds = np.append(np.inf, thresholds)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fpr = fps / fps[-1]
+        tpr = tps / tps[-1]
+    return fpr, tpr, thresholds
+
+
+def get_auc(fpr, tpr):
+    """Computes area under ROC curve with the trapezoidal rule."""
+    return np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2)
@@ -5,21 +5,182 @@ Usage:
     diffusion_experiment = Diffusion(network, input_nodes)
     result = diffusion.diffuse()
     print(result.head())
+
+If the network does not change between experiments, build the diffusion
+operator once and share it:
+
+    operator = DiffusionOperator(network)
+    result = Diffusion(network, input_nodes, operator=operator).diffuse()
+
+For small networks, kernel mode precomputes the full inverse of the
+operator, so a query is a sum of kernel columns for the input nodes:
+
+    operator = DiffusionOperator(network, use_kernel=True)
 """
 
+import hashlib
+import os
+import tempfile
 
 import numpy as np
-import pandas as pd
-from scipy import sparse, stats
-from scipy.sparse.linalg import lgmres
+from scipy import sparse
+from scipy.sparse.linalg import cg, splu
+
+# networks up to this size get a sparse LU factorization; larger networks
+# fill in too much and are solved with conjugate gradient instead
+FACTORIZE_MAX_SIZE = 2000
+
+
+class DiffusionOperator:
+    """Diffusion operator (I + alpha * L) of a fixed network, ready to solve."""
+
+    def __init__(self, network, use_kernel=False, kernel_fp=None):
+        """Builds the operator and, for small networks, its sparse LU factorization.
+
+        Parameters
+        ----------
+        network : similarity.Network
+            thresholded network; network.network is the adjacency matrix
+        use_kernel : bool, optional
+            if True, precompute the dense kernel (I + alpha * L)^-1 and answer
+            queries from it instead of the LU solver
+        kernel_fp : str, optional
+            .npy file to memory-map the kernel from; the kernel is computed
+            and written on first use, under a name keyed by the network
+            (see load_kernel)
+
+        Raises
+        ------
+        ValueError
+            if the network has no edges (ex: a "mutual" network with few
+            edges per protein)
+        """
+        adj_matrix = sparse.csr_matrix(network.network)
+        lpp = sparse.csgraph.laplacian(adj_matrix)
+        column_sums = np.asarray(abs(lpp).sum(axis=0)).ravel()
+        max_degree = float(column_sums.max()) if column_sums.size else 0.0
+        if max_degree == 0:
+            raise ValueError("Network has no edges, so there is nothing to diffuse.")
+        alpha = 1 / max_degree
+        ident = sparse.identity(adj_matrix.shape[0], format="csc")
+        self.size = adj_matrix.shape[0]
+        self.ps = sparse.csc_matrix(ident + alpha * lpp)
+        self._factor = None
+        if self.size <= FACTORIZE_MAX_SIZE:
+            self._factor = splu(self.ps, permc_spec="MMD_AT_PLUS_A")
+        self.kernel = None
+        if use_kernel:
+            self.kernel = self.load_kernel(kernel_fp)
+
+    def compute_kernel(self):
+        """Computes the dense kernel (Green's function) of the operator.
+
+        Returns
+        -------
+        kernel : numpy array
+            n x n matrix, where column j is the diffusion result seeded
+            only with node j
+        """
+        return self._solve(np.eye(self.size))
+
+    def load_kernel(self, kernel_fp=None):
+        """Loads kernel from a memory-mapped .npy file, or computes it.
+
+        The file is tied to one network: the hash of the operator is added
+        to its name ("kernel.npy" -> "kernel.<version>.npy"), so a kernel
+        computed for any other network (ex: a rebuild with the same
+        proteins) is never loaded.
+
+        Parameters
+        ----------
+        kernel_fp : str, optional
+            .npy file holding the kernel; written on first use
+
+        Returns
+        -------
+        kernel : numpy array
+            n x n kernel matrix
+        """
+        if kernel_fp is None:
+            return self.compute_kernel()
+        root, ext = os.path.splitext(kernel_fp)
+        kernel_fp = "%s.%s%s" % (root, self.get_version(), ext or ".npy")
+        if not os.path.exists(kernel_fp):
+            # write to a unique temporary file first, so that processes
+            # building the kernel at the same time never read or install
+            # a partially written one
+            fd, tmp_fp = tempfile.mkstemp(
+                dir=os.path.dirname(os.path.abspath(kernel_fp)), suffix=".tmp"
+            )
+            try:
+                with os.fdopen(fd, "wb") as kernel_file:
+                    np.save(kernel_file, self.compute_kernel())
+                os.replace(tmp_fp, kernel_fp)
+            except BaseException:
+                os.remove(tmp_fp)
+                raise
+        kernel = np.load(kernel_fp, mmap_mode="r")
+        if kernel.shape != (self.size, self.size):
+            raise ValueError(
+                "Kernel in %s has shape %s, expected %s."
+                % (kernel_fp, kernel.shape, (self.size, self.size))
+            )
+        return kernel
+
+    def get_version(self):
+        """Returns a hash of the operator matrix, used to key kernel files."""
+        ps = self.ps.sorted_indices()
+        version = hashlib.sha1()
+        version.update(np.int64(self.size).tobytes())
+        for array in (ps.indptr, ps.indices):
+            version.update(array.astype(np.int64).tobytes())
+        version.update(ps.data.astype(np.float64).tobytes())
+        return version.hexdigest()[:16]
+
+    def solve(self, initial_state):
+        """Diffuses initial state(s) across the network.
+
+        In kernel mode, only kernel rows of the labeled nodes are touched,
+        so a query with k labeled nodes costs O(k * n). Otherwise, the
+        state is diffused with a forward/back substitution, or with
+        conjugate gradient if the network is too big to factorize.
+
+        Parameters
+        ----------
+        initial_state : numpy array
+            vector (n,) or matrix (n, k) of initial node labels
+
+        Returns
+        -------
+        final_state : numpy array
+            post-diffusion state, same shape as initial_state
+        """
+        initial_state = np.asarray(initial_state, dtype=np.float64)
+        if self.kernel is None:
+            return self._solve(initial_state)
+        if initial_state.ndim == 1:
+            labeled = np.flatnonzero(initial_state)
+        else:
+            labeled = np.flatnonzero(initial_state.any(axis=1))
+        # the operator is symmetric, so kernel rows are kernel columns
+        return self.kernel[labeled].T @ initial_state[labeled]
 
-pd.options.mode.chained_assignment = None
+    def _solve(self, initial_state):
+        """Solves ps @ final_state = initial_state for vector or matrix input."""
+        if self._factor is not None:
+            return self._factor.solve(initial_state)
+        if initial_state.ndim == 1:
+            return cg(self.ps, initial_state, maxiter=1000, atol=1e-12)[0]
+        final_state = np.zeros_like(initial_state)
+        for column in range(initial_state.shape[1]):
+            final_state[:, column] = self._solve(initial_state[:, column])
+        return final_state
 
 
 class Diffusion:
     """Propagate information across a graph."""
 
-    def __init__(self, network, input_nodes):
+    def __init__(self, network, input_nodes, operator=None):
         """Inits diffusion experiment with network and starting input nodes.
 
         Parameters
@@ -28,32 +189,49 @@ class Diffusion:
             graph represented as an adjacency matrix
         input_nodes: list
             string ids of nodes that carry the initial label
+        operator : DiffusionOperator, optional
+            precomputed operator for the network; built on demand if None
         """
         self.network = network
         self.input_nodes = input_nodes  # this is where information is diffused from
+        self.operator = operator
 
     def get_node_indices(self, proteins):
         """Gets network position (matrix indices) for set of protein ids."""
-        hugo_ids = {k: v for v, k in enumerate(self.network.proteins)}
-        indices = [hugo_ids[protein] for protein in proteins]
-        return indices
+        return self.network.indices_for(proteins)
 
     def diffuse(self):
         """Diffuses information from input nodes across the graph."""
-        lpp = sparse.csgraph.laplacian(self.network.network)
-        alpha = 1 / float(np.max(np.sum(np.abs(lpp), axis=0)))
-        ident = sparse.csc_matrix(np.eye(self.network.network.shape[0]))
-        ps = ident + alpha * lpp
+        if self.operator is None:
+            self.operator = DiffusionOperator(self.network)
 
         initial_state = np.zeros(self.network.network.shape[0])
         input_indices = self.get_node_indices(self.input_nodes)
         initial_state[input_indices] = 1
 
-        diff_out = lgmres(ps, initial_state, maxiter=1000, atol=1e-12)
-        final_state = diff_out[0]
+        final_state = self.operator.solve(initial_state)
         result = DiffusionResult(final_state, initial_state, self.network.proteins)
         return result
 
+    def diffuse_each(self):
+        """Diffuses from every input node on its own, in one batched solve.
+
+        Returns
+        -------
+        final_states : numpy array
+            n x k matrix, where column j is the diffusion result seeded
+            only with input node j
+        """
+        if self.operator is None:
+            self.operator = DiffusionOperator(self.network)
+
+        input_indices = self.get_node_indices(self.input_nodes)
+        initial_states = np.zeros((self.network.network.shape[0], len(input_indices)))
+        initial_states[input_indices, np.arange(len(input_indices))] = 1
+
+        final_states = self.operator.solve(initial_states)
+        return final_states
+
 
 class DiffusionResult:
     """Class to namespace functions for dealing with diffusion output."""
@@ -64,7 +242,7 @@ class DiffusionResult:
         Parameters
         ----------
         result : numpy array
-            Output of scipy.sparse.linalg.lgmres call; diffusion result
+            Output of DiffusionOperator.solve call; diffusion result
         labels : list[str]
             List of input labels in the diffusion
         """
@@ -75,6 +253,8 @@ class DiffusionResult:
 
     def get_result_df(self):
         """Formats diffusion result as pandas df."""
+        import pandas as pd
+
         result = pd.DataFrame(
             {
                 "protein": self.proteins,
@@ -84,15 +264,120 @@ class DiffusionResult:
         )
         return result
 
+    def get_ranked_result(self):
+        """Scores non-input proteins with z-scores and ranks."""
+        is_unlabeled = np.asarray(self.initial_state) == 0
+        result = RankedResult(
+            np.asarray(self.proteins, dtype=object)[is_unlabeled],
+            np.asarray(self.initial_state)[is_unlabeled],
+            np.asarray(self.final_state)[is_unlabeled],
+            index=np.flatnonzero(is_unlabeled),
+        )
+        return result
+
     def get_result_df_with_zscore(self):
         """Formats diffusion result as pandas df and adds zscore & rank column."""
-        result = self.get_result_df()
-        result = result[result.initial_state == 0]
-        result["zscore"] = stats.zscore(result.final_state)
-        result["rank"] = result.zscore.rank(ascending=False)
-        result.sort_values(by="final_state", ascending=False, inplace=True)
-        return result
+        return self.get_ranked_result().to_df()
 
     def get_result_for_protein(self, protein):
         """Gets post-diffusion score for specific protein."""
         return self.protein_final_state[protein]
+
+
+class RankedResult:
+    """Post-diffusion scores with their z-scores and ranks, as NumPy arrays.
+
+    Rows are sorted by post-diffusion score, best first. A pandas data frame
+    is only built on request (see to_df).
+
+    Attributes
+    ----------
+    proteins : numpy array
+        protein names
+    initial_state : numpy array
+        1 for input proteins, 0 for the rest
+    final_state : numpy array
+        post-diffusion scores
+    zscore : numpy array
+        z-scores of the post-diffusion scores
+    rank : numpy array
+        rank of each protein by z-score (1 is best, ties share the average)
+    index : numpy array
+        position of each protein in the network
+    """
+
+    def __init__(self, proteins, initial_state, final_state, index=None):
+        """Inits result, computing z-scores and ranks in bulk.
+
+        Parameters
+        ----------
+        proteins : numpy array
+            protein names
+        initial_state : numpy array
+            1 for input proteins, 0 for the rest
+        final_state : numpy array
+            post-diffusion scores
+        index : numpy array, optional
+            position of each protein in the network; defaults to 0...n-1
+        """
+        if index is None:
+            index = np.arange(len(proteins))
+        final_state = np.asarray(final_state, dtype=float)
+        zscore = (final_state - final_state.mean()) / final_state.std()
+        rank = get_ranks(-zscore)
+        order = np.argsort(-final_state, kind="stable")
+        self.proteins = np.asarray(proteins, dtype=object)[order]
+        self.initial_state = np.asarray(initial_state)[order]
+        self.final_state = np.asarray(final_state)[order]
+        self.zscore = zscore[order]
+        self.rank = rank[order]
+        self.index = np.asarray(index)[order]
+
+    def __len__(self):
+        """Returns number of proteins in the result."""
+        return len(self.proteins)
+
+    def get_top_hits(self, zscore_cutoff):
+        """Returns mask of the proteins with z-score at or above cutoff."""
+        return self.zscore >= zscore_cutoff
+
+    def get_columns(self):
+        """Returns result table columns, by name."""
+        columns = {
+            "protein": self.proteins,
+            "initial_state": self.initial_state,
+            "final_state": self.final_state,
+            "zscore": self.zscore,
+            "rank": self.rank,
+        }
+        return columns
+
+    def to_records(self):
+        """Formats result as a list of row dicts (ex: for a Dash data table)."""
+        columns = {name: values.tolist() for name, values in self.get_columns().items()}
+        return [dict(zip(columns, row)) for row in zip(*columns.values())]
+
+    def to_df(self):
+        """Formats result as pandas df."""
+        import pandas as pd
+
+        return pd.DataFrame(self.get_columns(), index=self.index)
+
+
+def get_ranks(values):
+    """Ranks values from lowest (1) to highest; ties share the average rank.
+
+    Same as scipy.stats.rankdata with the default "average" method, without
+    importing scipy.stats (slow to import) on the app's startup path.
+    """
+    values = np.asarray(values)
+    order = np.argsort(values, kind="mergesort")
+    sorted_values = values[order]
+    is_first = np.concatenate(([True], sorted_values[1:] != sorted_values[:-1]))
+    tie_group = np.cumsum(is_first) - 1
+    group_start = np.flatnonzero(is_first)
+    group_stop = np.append(group_start[1:], len(values))
+    # ranks group_start + 1, ..., group_stop average to their midpoint
+    ranks = np.empty(len(values))
+    ranks[order] = ((group_start + 1 + group_stop) / 2)[tie_group]
+    return ranks
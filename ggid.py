@@ -0,0 +1,493 @@
+"""Command-line pipeline that builds the GO similarity kinase network.
+
+The build runs in stages: parse ontology, load annotations, compute
+specificity, compute similarity, threshold, validate and export. Each stage
+writes an artifact named after the hash of its inputs and parameters, so a
+rerun only recomputes stages whose inputs changed.
+
+Usage:
+
+    $ python ggid.py build --edges 5 --n-jobs 4
+    $ python ggid.py build --previous network/kinase_network/build.json
+    $ python ggid.py sweep --namespaces C P F --edges 1 3 5 10 --n-jobs 4
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import cross_validation
+import kinapp_helper
+import onto
+import similarity
+import sweep
+
+# benchmark kinase sets used by the validate stage
+VALIDATION_SETS = {
+    # kinases that phosphorylate p53
+    "p53": [
+        "CSNK2A1",
+        "CDK1",
+        "PRKDC",
+        "CDK2",
+        "MAPK8",
+        "CDK7",
+        "CSNK1D",
+        "MAPK9",
+        "EIF2AK2",
+        "CHEK1",
+        "CHEK2",
+        "GSK3B",
+        "MAPK1",
+        "PLK3",
+        "AURKA",
+        "TAF1",
+        "RPS6KA3",
+        "CDK9",
+        "CDK5",
+        "DYRK2",
+        "HIPK2",
+        "IKBKB",
+        "TTK",
+        "AURKB",
+        "CSNK1A1",
+        "RPS6KA1",
+    ],
+}
+
+
+def hash_file(file_path: str) -> str:
+    """Returns SHA-1 hex digest of a file's content."""
+    file_hash = hashlib.sha1()
+    with open(file_path, "rb") as input_file:
+        for chunk in iter(lambda: input_file.read(1 << 20), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+class Stage:
+    """One step of the build, with its dependencies and artifact format.
+
+    Attributes
+    ----------
+    name : str
+        stage name, also the artifact file prefix
+    inputs : List[str]
+        names of the stages whose output this stage consumes
+    params : Dict[str, Any]
+        settings that change the stage output (file hashes, cutoffs, ...)
+    run : Callable
+        computes the output from the outputs of the input stages
+    save : Callable
+        writes the output to an artifact path
+    load : Callable
+        reads the output back from an artifact path
+    """
+
+    def __init__(
+        self,
+        name: str,
+        inputs: List[str],
+        params: Dict[str, Any],
+        run: Callable,
+        save: Callable,
+        load: Callable,
+    ) -> None:
+        """Inits stage; see class docstring for parameters."""
+        self.name = name
+        self.inputs = inputs
+        self.params = params
+        self.run = run
+        self.save = save
+        self.load = load
+
+
+class BuildPipeline:
+    """Runs build stages in order, reusing artifacts from earlier runs."""
+
+    def __init__(self, stages: List[Stage], artifact_dir: str) -> None:
+        """Inits with stages (in dependency order) and artifact directory.
+
+        Parameters
+        ----------
+        stages : List[Stage]
+            build stages; every stage must come after its inputs
+        artifact_dir : str
+            directory holding the stage artifacts
+        """
+        self.stages = {stage.name: stage for stage in stages}
+        self.artifact_dir = artifact_dir
+        self.keys = {}
+        for stage in stages:
+            content = [stage.name, stage.params, [self.keys[i] for i in stage.inputs]]
+            self.keys[stage.name] = hashlib.sha1(
+                json.dumps(content, sort_keys=True).encode()
+            ).hexdigest()[:16]
+        self._outputs = {}
+
+    @classmethod
+    def from_manifest(cls, stages: List[Stage], manifest_fp: str) -> "BuildPipeline":
+        """Inits pipeline that loads the artifacts listed in a build manifest.
+
+        Parameters
+        ----------
+        stages : List[Stage]
+            build stages, only used for their load functions
+        manifest_fp : str
+            manifest written by save_manifest
+        """
+        with open(manifest_fp) as manifest_file:
+            manifest = json.load(manifest_file)
+        pipeline = cls(stages, manifest["artifact_dir"])
+        pipeline.keys = manifest["keys"]
+        return pipeline
+
+    def save_manifest(self, manifest_fp: str) -> None:
+        """Writes the artifact keys of this build, to diff a later build against."""
+        manifest = {
+            "artifact_dir": os.path.abspath(self.artifact_dir),
+            "keys": self.keys,
+        }
+        with open(manifest_fp, "w") as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+
+    def get_artifact_path(self, stage_name: str) -> str:
+        """Returns content-addressed artifact path of a stage."""
+        return os.path.join(
+            self.artifact_dir, "%s-%s" % (stage_name, self.keys[stage_name])
+        )
+
+    def get_output(self, stage_name: str) -> Any:
+        """Returns stage output, loading its artifact if it was not run."""
+        if stage_name not in self._outputs:
+            stage = self.stages[stage_name]
+            self._outputs[stage_name] = stage.load(self.get_artifact_path(stage_name))
+        return self._outputs[stage_name]
+
+    def run(self) -> None:
+        """Runs every stage whose artifact is missing and reports its cost."""
+        os.makedirs(self.artifact_dir, exist_ok=True)
+        for stage in self.stages.values():
+            artifact_path = self.get_artifact_path(stage.name)
+            if os.path.exists(artifact_path):
+                print("%-12s cached  (%s)" % (stage.name, self.keys[stage.name]))
+                continue
+            inputs = [self.get_output(name) for name in stage.inputs]
+            output = run_measured(stage.name, stage.run, *inputs)
+            # write to a temporary path first, so that a failed save never
+            # leaves a partial artifact behind
+            tmp_path = artifact_path + ".tmp"
+            stage.save(output, tmp_path)
+            os.replace(tmp_path, artifact_path)
+            self._outputs[stage.name] = output
+
+
+def run_measured(name: str, function: Callable, *args: Any) -> Any:
+    """Runs a build step and reports its wall time and peak memory."""
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    try:
+        output = function(*args)
+        wall_time = time.perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    print("%-12s ran in %8.2f s, peak memory %8.1f MB" % (name, wall_time, peak / 1e6))
+    return output
+
+
+def get_build_stages(args: argparse.Namespace) -> List[Stage]:
+    """Defines the network build stages for the given command-line arguments."""
+
+    def parse_ontology():
+        return onto.GoGraph(obo_fp=args.obo).read_obo()
+
+    def load_ontology(columns):
+        ontology = onto.GoGraph(obo_fp=args.obo)
+        ontology.load_columns(columns)
+        return ontology
+
+    def save_columns(columns, path):
+        with open(path, "wb") as artifact:
+            onto.GoGraph.write_columns(columns, artifact)
+
+    def load_annotations():
+        corpus = onto.Annotations(args.gaf, keep_namespace=args.namespace)
+        return corpus.annotations
+
+    def compute_specificity(columns, annotations):
+        ontology = load_ontology(columns)
+        corpus = onto.Annotations.from_frame(annotations, args.gaf)
+        return ontology.calculate_term_specificity(corpus)
+
+    def save_json(output, path):
+        with open(path, "w") as artifact:
+            json.dump(output, artifact)
+
+    def load_json(path):
+        with open(path) as artifact:
+            return json.load(artifact)
+
+    def compute_similarity(columns, annotations, term_specificity):
+        ontology = load_ontology(columns)
+        ontology.assign_term_specificity(term_specificity)
+        corpus = onto.Annotations.from_frame(annotations, args.gaf)
+        proteins = list(pd.read_csv(args.proteins).gene_symbol)
+        calculator = similarity.Calculator(corpus, ontology, proteins)
+        calculator.filter_proteins(min_annotations=args.min_annotations)
+        if getattr(args, "previous", None):
+            changed = calculator.update_similarity(
+                load_previous_calculator(args.previous), n_jobs=args.n_jobs
+            )
+            print(
+                "%-12s rescored pairs of %d/%d proteins"
+                % ("similarity", len(changed), len(calculator.proteins))
+            )
+        else:
+            calculator.calculate_similarity(n_jobs=args.n_jobs)
+        return calculator.protein_similarity, calculator.proteins
+
+    def load_previous_calculator(manifest_fp):
+        pipeline = BuildPipeline.from_manifest(get_build_stages(args), manifest_fp)
+        ontology = load_ontology(pipeline.get_output("ontology"))
+        ontology.assign_term_specificity(pipeline.get_output("specificity"))
+        corpus = onto.Annotations.from_frame(pipeline.get_output("annotations"), "")
+        protein_similarity, proteins = pipeline.get_output("similarity")
+        previous = similarity.Calculator(corpus, ontology, proteins)
+        previous.protein_similarity = protein_similarity
+        return previous
+
+    def save_similarity(output, path):
+        protein_similarity, proteins = output
+        with open(path, "wb") as artifact:
+            np.savez(
+                artifact,
+                row=protein_similarity.row,
+                col=protein_similarity.col,
+                data=protein_similarity.data,
+                proteins=np.array(proteins),
+            )
+
+    def load_similarity(path):
+        with np.load(path) as artifact:
+            proteins = artifact["proteins"].tolist()
+            protein_similarity = sparse.coo_matrix(
+                (artifact["data"], (artifact["row"], artifact["col"])),
+                shape=(len(proteins), len(proteins)),
+            )
+        return protein_similarity, proteins
+
+    def threshold(similarity_output):
+        protein_similarity, proteins = similarity_output
+        network = similarity.Network(protein_similarity, proteins)
+        network.threshold_matrix(n=args.edges)
+        network.enforce_network_symmetry()
+        return network
+
+    def save_network(network, path):
+        network.save(path)
+
+    def load_network(path):
+        return similarity.Network.load(path, mmap=False)
+
+    def validate(network):
+        auc = {}
+        for set_name, kinases in VALIDATION_SETS.items():
+            kinases = [k for k in kinases if network.has_protein(k)]
+            if len(kinases) < 2:
+                continue  # not enough of the set made it into the network
+            loo = cross_validation.LOOValitation(network, kinases)
+            loo.run_validation()
+            auc[set_name] = loo.get_roc()[2]
+        return auc
+
+    file_params = {
+        "obo": hash_file(args.obo),
+        "gaf": hash_file(args.gaf),
+        "proteins": hash_file(args.proteins),
+    }
+    return [
+        Stage(
+            "ontology",
+            [],
+            {"obo": file_params["obo"], "format": onto.OBO_COLUMNS_VERSION},
+            parse_ontology,
+            save_columns,
+            onto.GoGraph.read_columns,
+        ),
+        Stage(
+            "annotations",
+            [],
+            {"gaf": file_params["gaf"], "namespace": args.namespace},
+            load_annotations,
+            lambda frame, path: frame.to_pickle(path, compression=None),
+            lambda path: pd.read_pickle(path, compression=None),
+        ),
+        Stage(
+            "specificity",
+            ["ontology", "annotations"],
+            {},
+            compute_specificity,
+            save_json,
+            load_json,
+        ),
+        Stage(
+            "similarity",
+            ["ontology", "annotations", "specificity"],
+            {
+                "proteins": file_params["proteins"],
+                "min_annotations": args.min_annotations,
+            },
+            compute_similarity,
+            save_similarity,
+            load_similarity,
+        ),
+        Stage(
+            "threshold",
+            ["similarity"],
+            {"edges": args.edges, "schema": similarity.NETWORK_SCHEMA_VERSION},
+            threshold,
+            save_network,
+            load_network,
+        ),
+        Stage(
+            "validate",
+            ["threshold"],
+            {"sets": VALIDATION_SETS},
+            validate,
+            save_json,
+            load_json,
+        ),
+    ]
+
+
+def build(args: argparse.Namespace) -> None:
+    """Builds the network and exports it to the output directory."""
+    pipeline = BuildPipeline(get_build_stages(args), args.artifact_dir)
+    pipeline.run()
+    for set_name, auc in pipeline.get_output("validate").items():
+        print("%s LOO AUC = %1.3f" % (set_name, auc))
+    run_measured("export", export, pipeline, args.output)
+    print("network exported to %s" % args.output)
+
+
+def export(pipeline: BuildPipeline, output_dir: str) -> None:
+    """Copies the thresholded network to where the app loads it from.
+
+    The network is staged in a sibling temporary directory and then moved
+    into place, so a running app never sees a partial network; only the
+    rename of the old directory and the new one into place are not atomic.
+    """
+    output_dir = os.path.abspath(output_dir)
+    staging_dir = tempfile.mkdtemp(
+        dir=os.path.dirname(output_dir), prefix=".%s." % os.path.basename(output_dir)
+    )
+    try:
+        network_dir = os.path.join(staging_dir, "network")
+        shutil.copytree(pipeline.get_artifact_path("threshold"), network_dir)
+        # artifacts of this build, for a later incremental build (--previous)
+        pipeline.save_manifest(os.path.join(network_dir, "build.json"))
+        # prebuilt cytoscape view of the whole network, loaded by the app
+        kinapp_helper.save_network_elements(
+            pipeline.get_output("threshold"),
+            os.path.join(network_dir, "elements.json"),
+        )
+        old_dir = os.path.join(staging_dir, "old")
+        if os.path.exists(output_dir):
+            os.rename(output_dir, old_dir)
+        try:
+            os.rename(network_dir, output_dir)
+        except OSError:
+            if os.path.exists(old_dir):
+                os.rename(old_dir, output_dir)  # put the old network back
+            raise
+    finally:
+        shutil.rmtree(staging_dir)
+
+
+def run_sweep(args: argparse.Namespace) -> None:
+    """Scores networks over namespaces, edge counts and symmetry rules."""
+    similarity_networks = {}
+    for namespace in args.namespaces:
+        namespace_args = argparse.Namespace(**vars(args))
+        namespace_args.namespace = namespace
+        # the sweep only needs the similarity matrix, so stop the build there
+        stages = get_build_stages(namespace_args)
+        stages = stages[: [s.name for s in stages].index("similarity") + 1]
+        pipeline = BuildPipeline(stages, args.artifact_dir)
+        pipeline.run()
+        protein_similarity, proteins = pipeline.get_output("similarity")
+        similarity_networks[namespace] = similarity.Network(
+            protein_similarity, proteins
+        )
+    auc_table = sweep.sweep(
+        similarity_networks,
+        VALIDATION_SETS,
+        edges=args.edges,
+        rules=args.rules,
+        n_jobs=args.n_jobs,
+    )
+    print(
+        auc_table.pivot_table(
+            index="edges", columns=["benchmark_set", "namespace", "rule"], values="auc"
+        ).to_string(float_format="%1.3f")
+    )
+
+
+def main() -> None:
+    """Parses command-line arguments and runs the requested command."""
+    parser = argparse.ArgumentParser(prog="ggid", description=__doc__.split("\n")[0])
+    # no required=True: that keyword needs Python 3.7
+    subparsers = parser.add_subparsers(dest="command")
+    build_parser = subparsers.add_parser("build", help="build the kinase network")
+    build_parser.add_argument("--obo", default="data/go-basic.obo")
+    build_parser.add_argument("--gaf", default="data/goa_human.gaf")
+    build_parser.add_argument("--proteins", default="data/list_of_human_kinases.csv")
+    build_parser.add_argument("--namespace", default="P", help="C, P, or F")
+    build_parser.add_argument("--min-annotations", type=int, default=10)
+    build_parser.add_argument(
+        "--edges", type=int, default=5, help="edges to keep per protein"
+    )
+    build_parser.add_argument("--n-jobs", type=int, default=1)
+    build_parser.add_argument("--artifact-dir", default="build/artifacts")
+    build_parser.add_argument("--output", default="network/kinase_network")
+    build_parser.add_argument(
+        "--previous",
+        help="build.json of a previous build; only rescore protein pairs "
+        "whose similarity changed since then",
+    )
+    build_parser.set_defaults(func=build)
+    sweep_parser = subparsers.add_parser(
+        "sweep", help="score networks over namespaces, edge counts and rules"
+    )
+    sweep_parser.add_argument("--obo", default="data/go-basic.obo")
+    sweep_parser.add_argument("--gaf", default="data/goa_human.gaf")
+    sweep_parser.add_argument("--proteins", default="data/list_of_human_kinases.csv")
+    sweep_parser.add_argument("--namespaces", nargs="+", default=["C", "P", "F"])
+    sweep_parser.add_argument("--min-annotations", type=int, default=10)
+    sweep_parser.add_argument(
+        "--edges", type=int, nargs="+", default=[1, 2, 3, 5, 10, 20]
+    )
+    sweep_parser.add_argument("--rules", nargs="+", default=["union", "mutual"])
+    sweep_parser.add_argument("--n-jobs", type=int, default=1)
+    sweep_parser.add_argument("--artifact-dir", default="build/artifacts")
+    sweep_parser.set_defaults(func=run_sweep)
+    args = parser.parse_args()
+    if args.command is None:
+        parser.print_help()
+        parser.exit(2)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
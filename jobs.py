@@ -0,0 +1,214 @@
+"""
+Runs slow experiments (ex: LOO cross-validation) in background processes,
+so that a web request only submits a job and the client polls for it.
+
+Typical usage example:
+
+    queue = JobQueue(max_workers=2)
+    job_id = queue.submit(key, slow_function, *args)  # same key, same job
+    status, elapsed = queue.get_status(job_id)
+    if status == "done":
+        result = queue.get_result(job_id)
+"""
+
+import pickle
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Tuple, Union
+
+# job states reported by JobQueue.get_status
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+UNKNOWN = "unknown"
+
+CREATE_JOB_TABLE = (
+    "CREATE TABLE IF NOT EXISTS jobs "
+    "(job_id TEXT PRIMARY KEY, status TEXT, submitted REAL, result BLOB, error TEXT)"
+)
+
+
+class JobQueue:
+    """Process pool with job deduplication and status polling.
+
+    Jobs are tracked in memory by default. If db_fp is given, they are
+    tracked in an SQLite file instead, so that a job submitted through one
+    gunicorn worker can be polled and collected through any other.
+
+    Attributes
+    ----------
+    max_workers : int
+        number of worker processes
+    db_fp : str, None
+        SQLite file of the shared job table, None to track jobs in memory
+    timeout : float
+        seconds after which an unfinished job is considered lost (ex: its
+        gunicorn worker was restarted) and can be submitted again
+    ttl : float
+        seconds that finished jobs are kept for collection
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 2,
+        db_fp: Union[str, None] = None,
+        timeout: float = 600,
+        ttl: float = 3600,
+    ) -> None:
+        """Inits queue; the worker processes start with the first job."""
+        self.max_workers = max_workers
+        self.db_fp = db_fp
+        self.timeout = timeout
+        self.ttl = ttl
+        self._executor = None
+        self._jobs = {}  # job id -> (future, submit time), for in-memory mode
+        self._lock = threading.Lock()
+        if db_fp is not None:
+            with self._connect() as db:
+                db.execute(CREATE_JOB_TABLE)
+
+    def submit(self, job_id: str, function: Callable, *args: Any) -> str:
+        """Submits function(*args) as a job, unless the job already exists.
+
+        Parameters
+        ----------
+        job_id : str
+            identifies the job; submissions with the id of a running or
+            finished job are deduplicated
+        function : Callable
+            picklable, module-level function to run in a worker process
+        args : Any
+            picklable arguments of the function
+
+        Returns
+        -------
+        job_id : str
+            the id, for polling with get_status
+        """
+        if self.db_fp is None:
+            with self._lock:
+                self._remove_expired_jobs()
+                status, _ = self.get_status(job_id)
+                if status in (RUNNING, DONE):
+                    return job_id
+                future = self._get_executor().submit(function, *args)
+                self._jobs[job_id] = (future, time.time())
+            return job_id
+        with self._connect() as db:
+            # lock the table, so that concurrent submissions of the same job
+            # from several gunicorn workers start it only once
+            db.execute("BEGIN IMMEDIATE")
+            db.execute(
+                "DELETE FROM jobs WHERE status != ? AND submitted < ?",
+                (RUNNING, time.time() - self.ttl),
+            )
+            status, _ = self._get_status_from_db(db, job_id)
+            if status in (RUNNING, DONE):
+                return job_id
+            db.execute(
+                "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, NULL, NULL)",
+                (job_id, RUNNING, time.time()),
+            )
+        future = self._get_executor().submit(function, *args)
+        future.add_done_callback(lambda f: self._save_job_result(job_id, f))
+        return job_id
+
+    def get_status(self, job_id: str) -> Tuple[str, float]:
+        """Returns job state (running, done, failed or unknown) and its age (s)."""
+        if self.db_fp is not None:
+            with self._connect() as db:
+                return self._get_status_from_db(db, job_id)
+        if job_id not in self._jobs:
+            return UNKNOWN, 0.0
+        future, submitted = self._jobs[job_id]
+        if not future.done():
+            status = RUNNING
+        elif future.exception() is not None:
+            status = FAILED
+        else:
+            status = DONE
+        return status, time.time() - submitted
+
+    def get_result(self, job_id: str) -> Any:
+        """Returns result of a finished job.
+
+        Raises
+        ------
+        RuntimeError
+            if the job failed (with the error of the job) or is not done
+        """
+        if self.db_fp is None:
+            future, _ = self._jobs[job_id]
+            if not future.done():
+                raise RuntimeError("Job %s is not done." % job_id)
+            if future.exception() is not None:
+                raise RuntimeError("Job %s failed: %r" % (job_id, future.exception()))
+            return future.result()
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT status, result, error FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        if row is None or row[0] == RUNNING:
+            raise RuntimeError("Job %s is not done." % job_id)
+        if row[0] == FAILED:
+            raise RuntimeError("Job %s failed: %s" % (job_id, row[2]))
+        return pickle.loads(row[1])
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Returns the process pool, starting it on first use."""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def _remove_expired_jobs(self) -> None:
+        """Forgets in-memory jobs that finished more than ttl seconds ago."""
+        now = time.time()
+        for job_id, (future, submitted) in list(self._jobs.items()):
+            if future.done() and now - submitted > self.ttl:
+                del self._jobs[job_id]
+
+    def _connect(self) -> "_ClosingConnection":
+        """Opens a connection to the job table (one per call and thread)."""
+        db = sqlite3.connect(self.db_fp, timeout=30, isolation_level=None)
+        return _ClosingConnection(db)
+
+    def _get_status_from_db(self, db: sqlite3.Connection, job_id: str) -> tuple:
+        """Reads job state and age from the job table."""
+        row = db.execute(
+            "SELECT status, submitted FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return UNKNOWN, 0.0
+        status, age = row[0], time.time() - row[1]
+        if status == RUNNING and age > self.timeout:
+            status = FAILED  # lost, ex: its gunicorn worker was restarted
+        return status, age
+
+    def _save_job_result(self, job_id: str, future: Future) -> None:
+        """Writes the outcome of a finished job to the job table."""
+        if future.exception() is not None:
+            row = (FAILED, None, repr(future.exception()), job_id)
+        else:
+            row = (DONE, pickle.dumps(future.result()), None, job_id)
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ? WHERE job_id = ?",
+                row,
+            )
+
+
+class _ClosingConnection:
+    """Context manager that commits (or rolls back) and closes a connection."""
+
+    def __init__(self, db: sqlite3.Connection) -> None:
+        self.db = db
+
+    def __enter__(self) -> sqlite3.Connection:
+        return self.db
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if self.db.in_transaction:
+            self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+        self.db.close()
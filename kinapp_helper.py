@@ -3,12 +3,19 @@ Helper functions for the kinase network diffusion program.
 
 Typical usage example:
 
-    validator = InputValidator()
+    validator = get_input_validator()
     legal_ids = validator.validate(list_of_protein_ids)
+    hugo_ids = validator.resolve(list_of_protein_ids)
+    elements = load_network_elements(network, 'network/kinase_network/elements.json')
 
 """
 
-import pandas as pd
+import functools
+import json
+import os
+
+import numpy as np
+from scipy import sparse
 
 class InputValidator:
     """
@@ -17,28 +24,68 @@ class InputValidator:
     Attributes
     ----------
 
-    uniprot : list
-        list of kinase ids in uniprot format (uniprot.com)
-    hugo : list
-        list of kinase ids in HUGO format (https://www.genenames.org/)
+    uniprot : frozenset
+        set of kinase ids in uniprot format (uniprot.com)
+    hugo : frozenset
+        set of kinase ids in HUGO format (https://www.genenames.org/)
+    canonical : dict
+        maps every known kinase id (HUGO symbol, synonym or uniprot id)
+        to its HUGO symbol
     kinase_fp : str
         file path of the CSV file with the ids
     """
 
-    def __init__(self):
+    def __init__(self, kinase_fp='data/list_of_human_kinases.csv'):
         """
         Inits InputValidator class and loads list of legal kinase ids.
         """
-        self.kinase_fp = 'data/list_of_human_kinases.csv'
+        self.kinase_fp = kinase_fp
         self.parse_kinase_file()
 
     def parse_kinase_file(self):
         """
-        Parses uniprot & hugo IDs from the CSV file.
+        Parses uniprot, synonym & hugo IDs from the CSV file.
         """
-        kinase_df = pd.read_csv(self.kinase_fp)
-        self.uniprot = [p.upper() for p in list(kinase_df['uniprot'])]
-        self.hugo = [p.upper() for p in list(kinase_df['gene_symbol'])]
+        import pandas as pd  # deferred until the first request needs it
+
+        kinase_df = pd.read_csv(
+            self.kinase_fp, usecols=['gene_symbol', 'gene_synonym', 'uniprot']
+        ).dropna(subset=['gene_symbol'])
+        hugo = kinase_df['gene_symbol'].str.upper()
+        self.uniprot = frozenset(kinase_df['uniprot'].dropna().str.upper())
+        self.hugo = frozenset(hugo)
+        # later columns win, so a HUGO symbol always maps to itself
+        self.canonical = {}
+        for column in ['uniprot', 'gene_synonym']:
+            known = kinase_df[column].notna()
+            ids = kinase_df[column][known].str.upper()
+            self.canonical.update(zip(ids, hugo[known]))
+        self.canonical.update(zip(hugo, hugo))
+
+    def resolve(self, inputs):
+        """
+        Maps user-supplied protein ids to their HUGO symbols.
+
+        Parameters
+        ---------
+        inputs : list
+            list of protein id strings (HUGO, synonym or uniprot)
+
+        Returns
+        -------
+        resolved : dict
+            maps each recognized input id to its HUGO symbol,
+            in the order of the inputs
+        """
+        if not isinstance(inputs, list):
+            raise ValueError("expected a list")
+        canonical = self.canonical
+        resolved = {}
+        for protein in inputs:
+            hugo = canonical.get(protein.upper())
+            if hugo is not None:
+                resolved[protein] = hugo
+        return resolved
 
     def validate(self, inputs):
         """
@@ -52,12 +99,73 @@ class InputValidator:
         Returns
         -------
         validated : list
-            subset of input proteins that are actually present in network
+            HUGO symbols of the recognized input proteins, without repeats
         """
+        return list(dict.fromkeys(self.resolve(inputs).values()))
+
+
+@functools.lru_cache(maxsize=None)
+def get_input_validator(kinase_fp='data/list_of_human_kinases.csv'):
+    """
+    Returns the shared InputValidator, parsing the kinase file only once.
+    """
+    return InputValidator(kinase_fp)
+
+
+def get_network_elements(network):
+    """
+    Constructs cytoscape view of the entire network.
+
+    Parameters
+    ----------
+    network : similarity.Network
+        thresholded, symmetric protein network
+
+    Returns
+    -------
+    elements : list
+        cytoscape node elements for every connected protein, followed by
+        one edge element per connected pair
+    """
+    # the matrix is symmetrical, so the upper triangle holds each edge once
+    edges = sparse.triu(network.network, k=1).tocoo()
+    connected = np.unique(np.concatenate((edges.row, edges.col)))
+    proteins = network.proteins
+    elements = [
+        {'data': {'id': proteins[i], 'label': proteins[i]}} for i in connected
+    ]
+    elements += [
+        {'data': {'source': proteins[i], 'target': proteins[j]}}
+        for i, j in zip(edges.row.tolist(), edges.col.tolist())
+    ]
+    return elements
 
-        if not isinstance(inputs, list):
-            raise ValueError("expected a list")
 
-        inputs = [protein.upper() for protein in inputs]
-        validated = [protein for protein in inputs if protein in self.hugo]
-        return validated
+def save_network_elements(network, elements_fp):
+    """
+    Saves cytoscape view of the entire network as a JSON asset.
+
+    The asset records the network version, so that a stale asset is
+    detected after the network is rebuilt.
+    """
+    asset = {
+        'version': network.get_version(),
+        'elements': get_network_elements(network),
+    }
+    with open(elements_fp, 'w') as elements_file:
+        json.dump(asset, elements_file)
+
+
+def load_network_elements(network, elements_fp):
+    """
+    Loads cytoscape view of the entire network from its JSON asset.
+
+    Falls back to building the view if the asset is missing or was made
+    for a different version of the network.
+    """
+    if os.path.exists(elements_fp):
+        with open(elements_fp) as elements_file:
+            asset = json.load(elements_file)
+        if asset['version'] == network.get_version():
+            return asset['elements']
+    return get_network_elements(network)
@@ -1,10 +1,19 @@
+import hashlib
+import os
 import re
-from typing import Dict, List, Type, Union
+from typing import IO, Dict, List, Tuple, Type, Union
 
 import numpy as np
 import pandas as pd
 from scipy import sparse
 
+# GO id of the ancestor in "is_a" and "relationship" lines
+ANCESTOR_ID_PATTERN = re.compile(r"(GO:\d{7})\s!\s")
+
+# version of the parsed .obo columns and their binary format; bump it when
+# read_obo or write_columns change, so that old caches are not reused
+OBO_COLUMNS_VERSION = 2
+
 
 class GoTerm:
     """GO term node in the Gene Ontology tree/dag.
@@ -23,6 +32,17 @@ class GoTerm:
         list of the term's child terms
     """
 
+    __slots__ = [
+        "id",
+        "namespace",
+        "name",
+        "definition",
+        "ancestor_ids",
+        "ancestors",
+        "children",
+        "specificity",
+    ]
+
     def __init__(self, id_: str) -> None:
         """Inits with GO term id.
 
@@ -61,6 +81,105 @@ class GoTerm:
         self.ancestors.append(ancestor_term)
 
 
+class AncestryIndex:
+    """Transitive closure of the GO DAG over integer term ids.
+
+    Attributes
+    ----------
+    term_ids : List[str]
+        sorted GO ids, so that term_ids[i] is the term with integer id i
+    term_index : Dict[str, int]
+        mapping of GO ids to integer ids
+    matrix : sparse.csr_matrix
+        boolean matrix where cell i, j is True if term j is an ancestor of term i
+    """
+
+    def __init__(self, nodes: Dict[str, GoTerm]) -> None:
+        """Builds the closure in one topological pass over the graph.
+
+        Parameters
+        ----------
+        nodes : Dict[str, GoTerm]
+            connected GO term nodes, addressed by id
+        """
+        self.term_ids = sorted(nodes)
+        self.term_index = {term: index for index, term in enumerate(self.term_ids)}
+        parents = [
+            np.array([self.term_index[a.id] for a in nodes[term].ancestors], dtype=int)
+            for term in self.term_ids
+        ]
+        ancestors = [None] * len(self.term_ids)
+        for index in self._get_topological_order(parents):
+            ancestors[index] = np.unique(
+                np.concatenate(
+                    [parents[index]] + [ancestors[p] for p in parents[index]]
+                )
+            )
+        indptr = np.concatenate(([0], np.cumsum([len(a) for a in ancestors])))
+        indices = np.concatenate(ancestors) if ancestors else np.array([], dtype=int)
+        self.matrix = sparse.csr_matrix(
+            (np.ones(len(indices), dtype=bool), indices, indptr),
+            shape=(len(self.term_ids), len(self.term_ids)),
+        )
+
+    @staticmethod
+    def _get_topological_order(parents: List[np.array]) -> List[int]:
+        """Orders terms so that every term comes after all of its parents."""
+        num_parents = np.array([len(p) for p in parents])
+        children = [[] for _ in parents]
+        for child, child_parents in enumerate(parents):
+            for parent in child_parents:
+                children[parent].append(child)
+        order = list(np.flatnonzero(num_parents == 0))
+        for term in order:  # order grows as terms become ready
+            for child in children[term]:
+                num_parents[child] -= 1
+                if num_parents[child] == 0:
+                    order.append(child)
+        if len(order) != len(parents):
+            raise ValueError("GO graph has a cycle.")
+        return order
+
+    def get_ancestor_indices(self, term_id: str) -> np.array:
+        """Returns sorted integer ids of all ancestors of a term.
+
+        Parameters
+        ----------
+        term_id : str
+            GO term id (ex: 'GO:0000001')
+        """
+        index = self.term_index[term_id]
+        return self.matrix.indices[
+            self.matrix.indptr[index] : self.matrix.indptr[index + 1]
+        ]
+
+    def get_ancestors(self, term_id: str) -> List[str]:
+        """Returns GO ids of all ancestors of a term.
+
+        Parameters
+        ----------
+        term_id : str
+            GO term id (ex: 'GO:0000001')
+        """
+        return [self.term_ids[i] for i in self.get_ancestor_indices(term_id)]
+
+    def get_common_ancestor_indices(self, term1: str, term2: str) -> np.array:
+        """Returns integer ids of ancestors shared by two terms.
+
+        Parameters
+        ----------
+        term1 : str
+            id of the first GO term of interest
+        term2 : str
+            id of the second GO term of interest
+        """
+        return np.intersect1d(
+            self.get_ancestor_indices(term1),
+            self.get_ancestor_indices(term2),
+            assume_unique=True,
+        )
+
+
 class GoGraph:
     """Graph implementation of the Gene term Ontology.
 
@@ -81,40 +200,176 @@ class GoGraph:
         # keep track of all nodes using a dictionary
         self.nodes = {}
         self.obo_fp = obo_fp
-        self._full_ancestry = {}
-
-    def parse_ontology(self) -> None:
-        """Parses the .obo file."""
-        obo_file = open(self.obo_fp, "r")
-        term_flag = False
-        for line in obo_file:
-            capture = re.search("(.+):\s(.+)\n", line)
-            if line == "[Term]\n":
-                term_flag = True
-            elif line == "\n":
-                term_flag = False
-            if capture and term_flag:
-                name = capture.group(1)
-                content = capture.group(2)
-                if name == "id":
-                    go_term = GoTerm(id_=content)
-                    self.add_node(go_term)  # push term into dict
-                elif name in ["is_a", "relationship"]:
-                    capture = re.search("(GO:\d{7})\s!\s", content)
-                    ancestor_id = capture.group(1)
-                    go_term.ancestor_ids.append(ancestor_id)
-                elif name == "name":
-                    go_term.name = content
-                elif name == "namespace":
-                    go_term.namespace = content
-                elif name == "def":
-                    go_term.definition = content
-                elif name == "is_obsolete":
-                    # obsolete status is the last line in the term entry
-                    # we don't want obsolete terms in the tree
-                    del self.nodes[go_term.id]
-        obo_file.close()
+        self._ancestry = None
+        self._specificity = None
+
+    def parse_ontology(self, cache_dir: Union[str, None] = None) -> None:
+        """Parses the .obo file.
+
+        Parameters
+        ----------
+        cache_dir : str, optional
+            directory for a binary cache of the parsed file, keyed by the
+            hash of the .obo file; reruns on the same file skip parsing
+        """
+        if cache_dir is None:
+            columns = self.read_obo()
+        else:
+            cache_fp = os.path.join(
+                cache_dir,
+                "%s.%s.v%d.npz"
+                % (
+                    os.path.basename(self.obo_fp),
+                    self._hash_obo(),
+                    OBO_COLUMNS_VERSION,
+                ),
+            )
+            if os.path.exists(cache_fp):
+                columns = self.read_columns(cache_fp)
+            else:
+                columns = self.read_obo()
+                os.makedirs(cache_dir, exist_ok=True)
+                self.write_columns(columns, cache_fp)
+        self.load_columns(columns)
+
+    @staticmethod
+    def write_columns(columns: Dict[str, List[str]], file: Union[str, IO]) -> None:
+        """Writes string columns to an .npz file.
+
+        Each column is stored as one UTF-8 byte blob plus an array of string
+        offsets, so long strings (ex: definitions) do not pad the short ones.
+
+        Parameters
+        ----------
+        columns : Dict[str, List[str]]
+            columns of strings, as returned by read_obo
+        file : str or file
+            .npz file path or binary file object
+        """
+        arrays = {}
+        for name, column in columns.items():
+            encoded = [value.encode("utf-8") for value in column]
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            np.cumsum([len(value) for value in encoded], out=offsets[1:])
+            arrays[name + "_utf8"] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+            arrays[name + "_offsets"] = offsets
+        np.savez(file, **arrays)
+
+    @staticmethod
+    def read_columns(file: Union[str, IO]) -> Dict[str, List[str]]:
+        """Reads string columns written by write_columns.
+
+        Parameters
+        ----------
+        file : str or file
+            .npz file path or binary file object
+
+        Returns
+        -------
+        columns : Dict[str, List[str]]
+            columns of strings
+        """
+        columns = {}
+        with np.load(file) as arrays:
+            for key in arrays.files:
+                if not key.endswith("_offsets"):
+                    continue
+                name = key[: -len("_offsets")]
+                blob = arrays[name + "_utf8"].tobytes()
+                offsets = arrays[key].tolist()
+                columns[name] = [
+                    blob[start:end].decode("utf-8")
+                    for start, end in zip(offsets[:-1], offsets[1:])
+                ]
+        return columns
+
+    def load_columns(self, columns: Dict[str, List[str]]) -> None:
+        """Builds the term graph from parsed .obo columns.
+
+        Parameters
+        ----------
+        columns : Dict[str, List[str]]
+            term and edge columns, as returned by read_obo
+        """
+        for id_, name, namespace, definition in zip(
+            columns["id"], columns["name"], columns["namespace"], columns["definition"]
+        ):
+            go_term = GoTerm(id_=id_)
+            go_term.name = name
+            go_term.namespace = namespace
+            go_term.definition = definition
+            self.add_node(go_term)  # push term into dict
+        for child_id, ancestor_id in zip(columns["child_id"], columns["ancestor_id"]):
+            self.nodes[child_id].ancestor_ids.append(ancestor_id)
         self.draw_connections()  # connect terms
+        self._ancestry = None
+
+    def read_obo(self) -> Dict[str, List[str]]:
+        """Streams the .obo file into columns of term fields.
+
+        Returns
+        -------
+        columns : Dict[str, List[str]]
+            "id", "name", "namespace" and "definition" columns with one entry
+            per term, plus "child_id" and "ancestor_id" columns with one entry
+            per is_a/relationship edge; obsolete terms are left out
+        """
+        columns = {
+            name: []
+            for name in [
+                "id",
+                "name",
+                "namespace",
+                "definition",
+                "child_id",
+                "ancestor_id",
+            ]
+        }
+        term = None
+        with open(self.obo_fp, "r") as obo_file:
+            for line in obo_file:
+                if line.startswith("["):
+                    self._add_term_to_columns(term, columns)
+                    term = {"ancestor_ids": []} if line == "[Term]\n" else None
+                    continue
+                if term is None:
+                    continue
+                tag, _, content = line.rstrip("\n").partition(": ")
+                if tag == "id":
+                    term["id"] = content
+                elif tag == "is_a" or tag == "relationship":
+                    capture = ANCESTOR_ID_PATTERN.search(content)
+                    if capture:
+                        term["ancestor_ids"].append(capture.group(1))
+                elif tag == "name" or tag == "namespace":
+                    term[tag] = content
+                elif tag == "def":
+                    term["definition"] = content
+                elif tag == "is_obsolete" and content == "true":
+                    # we don't want obsolete terms in the tree
+                    term["is_obsolete"] = True
+        self._add_term_to_columns(term, columns)
+        return columns
+
+    @staticmethod
+    def _add_term_to_columns(
+        term: Union[Dict, None], columns: Dict[str, List[str]]
+    ) -> None:
+        """Appends a parsed [Term] stanza to the columns, unless obsolete."""
+        if term is None or "id" not in term or term.get("is_obsolete"):
+            return
+        for name in ["id", "name", "namespace", "definition"]:
+            columns[name].append(term.get(name, ""))
+        columns["child_id"].extend([term["id"]] * len(term["ancestor_ids"]))
+        columns["ancestor_id"].extend(term["ancestor_ids"])
+
+    def _hash_obo(self) -> str:
+        """Returns SHA-1 hex digest of the .obo file."""
+        obo_hash = hashlib.sha1()
+        with open(self.obo_fp, "rb") as obo_file:
+            for chunk in iter(lambda: obo_file.read(1 << 20), b""):
+                obo_hash.update(chunk)
+        return obo_hash.hexdigest()
 
     def add_node(self, node: Type[GoTerm]) -> None:
         """Pushes a new node into the node dictionary.
@@ -192,6 +447,12 @@ class GoGraph:
                 ancestors.extend(self.traverse(ancestor.id))
         return ancestors
 
+    def get_ancestry_index(self) -> AncestryIndex:
+        """Returns transitive closure of the graph, building it on first use."""
+        if self._ancestry is None:
+            self._ancestry = AncestryIndex(self.nodes)
+        return self._ancestry
+
     def get_full_ancestry(self, node_id: str) -> List[str]:
         """Returns all ancestors for a given term.
 
@@ -204,12 +465,45 @@ class GoGraph:
             ancestors : list
                 list of acestor GO term ids
         """
-        if node_id in self._full_ancestry:
-            return self._full_ancestry[node_id]
-        else:
-            full_ancestry = list(set(self.traverse(node_id)))
-            self._full_ancestry[node_id] = full_ancestry
-            return full_ancestry
+        return self.get_ancestry_index().get_ancestors(node_id)
+
+    def get_common_ancestors(self, term1: str, term2: str) -> List[str]:
+        """Returns ancestors shared by two terms.
+
+        Parameters
+        ----------
+        term1 : str
+            id of the first GO term of interest
+        term2 : str
+            id of the second GO term of interest
+
+        Returns
+        -------
+        ancestors : list
+            list of common ancestor GO term ids
+        """
+        ancestry = self.get_ancestry_index()
+        indices = ancestry.get_common_ancestor_indices(term1, term2)
+        return [ancestry.term_ids[i] for i in indices]
+
+    def get_specificity_vector(self) -> np.array:
+        """Returns specificity of each term, ordered by integer term id.
+
+        Returns
+        -------
+        specificity : np.array
+            specificity[i] is the specificity of term ancestry.term_ids[i],
+            0 for terms without assigned specificity
+        """
+        if self._specificity is None:
+            self._specificity = np.array(
+                [
+                    self.nodes[term].specificity or 0
+                    for term in self.get_ancestry_index().term_ids
+                ],
+                dtype=float,
+            )
+        return self._specificity
 
     def calculate_term_specificity(
         self, annotations: Type["Annotations"]
@@ -226,13 +520,27 @@ class GoGraph:
         term_specificity : dict[str, float]
             mapping of terms to their specificty (neg log frequency)
         """
-        full_ancestry = {}
-        for node_id in list(self.nodes):
-            full_ancestry[node_id] = self.get_full_ancestry(node_id)
-        spec_calc = SpecificityCalculator(full_ancestry, annotations)
+        spec_calc = SpecificityCalculator(self.get_ancestry_index(), annotations)
         term_specificity = spec_calc.get_specificity()
         return term_specificity
 
+    def get_term_counts(self, annotations: Type["Annotations"]) -> np.array:
+        """Returns full annotation count of each term, ordered by integer term id.
+
+        Parameters
+        ----------
+        annotations : Annotations
+            GO term annotation corpus
+
+        Returns
+        -------
+        full_count : np.array
+            full_count[i] is the number of annotations to ancestry.term_ids[i]
+            or any of its descendants (see SpecificityCalculator.get_full_count)
+        """
+        spec_calc = SpecificityCalculator(self.get_ancestry_index(), annotations)
+        return spec_calc.get_full_count()
+
     def assign_term_specificity(self, term_specificity: Dict[str, float]) -> None:
         """Assigns term specificity to each term in the tree.
 
@@ -243,18 +551,36 @@ class GoGraph:
         """
         for term, specificity in term_specificity.items():
             self.nodes[term].specificity = specificity
+        self._specificity = None
 
 
 class Annotations:
     """Container for storing annotation data."""
 
-    def __init__(self, anno_fp: str) -> None:
+    # GAF columns the pipeline uses; the rest of the file is never loaded
+    columns = ["DB_Object_Symbol", "Qualifier", "GO_ID", "Evidence_Code", "Aspect"]
+
+    def __init__(
+        self,
+        anno_fp: str,
+        keep_namespace: Union[str, None] = None,
+        exclude_evidence: Union[List[str], None] = None,
+        chunksize: int = 500000,
+    ) -> None:
         """Inits with path to annotations gaf file.
 
         Parameters
         ----------
         anno_fp : str
             path to annotations file in gaf-2 format
+        keep_namespace : str, optional
+            string token of namespace to keep (C, P, or F); other annotations
+            are dropped while the file is read
+        exclude_evidence : List[str], optional
+            evidence codes (ex: ["IEA", "ND"]) whose annotations are dropped
+            while the file is read
+        chunksize : int, optional
+            number of lines to read and filter at a time
         """
         self.anno_fp = anno_fp
         header = [
@@ -276,8 +602,56 @@ class Annotations:
             "Annotation_Extension",
             "Gene_Product_Form_ID",
         ]
-        self.annotations = pd.read_csv(anno_fp, header=None, sep="\t", comment="!")
-        self.annotations.columns = header
+        if keep_namespace is not None:
+            keep_namespace = self._validate_namespace(keep_namespace)
+        reader = pd.read_csv(
+            anno_fp,
+            header=None,
+            names=header,
+            usecols=self.columns,
+            sep="\t",
+            comment="!",
+            dtype=str,
+            chunksize=chunksize,
+        )
+        chunks = []
+        for chunk in reader:
+            if keep_namespace is not None:
+                chunk = chunk.loc[chunk.Aspect == keep_namespace, :]
+            if exclude_evidence:
+                chunk = chunk.loc[~chunk.Evidence_Code.isin(exclude_evidence), :]
+            chunks.append(chunk)
+        if chunks:
+            annotations = pd.concat(chunks, ignore_index=True)
+        else:
+            annotations = pd.DataFrame(columns=self.columns, dtype=str)
+        self.annotations = annotations[self.columns].astype("category")
+
+    @classmethod
+    def from_frame(cls, annotations: pd.DataFrame, anno_fp: str) -> "Annotations":
+        """Inits from an already loaded annotations data frame.
+
+        Parameters
+        ----------
+        annotations : pd.DataFrame
+            annotations table with the columns listed in Annotations.columns
+        anno_fp : str
+            path of the gaf file the annotations were read from
+        """
+        corpus = cls.__new__(cls)
+        corpus.anno_fp = anno_fp
+        corpus.annotations = annotations
+        return corpus
+
+    @staticmethod
+    def _validate_namespace(namespace: str) -> str:
+        """Returns upper-cased namespace token, or raises if it is not C, P, or F."""
+        legal_namespace = ["C", "P", "F"]
+        if namespace.upper() not in legal_namespace:
+            raise ValueError(
+                "Namespace must be one of: %s" % ", ".join(legal_namespace)
+            )
+        return namespace.upper()
 
     def get_counts(self) -> Dict[str, int]:
         """Counts number of times terms appear in annotation corpus.
@@ -287,7 +661,8 @@ class Annotations:
         counts : Dict[str, int]
             term counts
         """
-        counts = self.annotations.groupby("GO_ID").size()
+        counts = self.annotations.groupby("GO_ID", observed=True).size()
+        counts.index = counts.index.astype(str)
         return counts
 
     def filter(self, keep_namespace: str) -> None:
@@ -298,38 +673,70 @@ class Annotations:
         keep_namespace : str
             string token of namespace to keep (C, P, or F)
         """
-        legal_namespace = ["C", "P", "F"]
-        if keep_namespace.upper() not in legal_namespace:
-            raise ValueError(
-                "Namespace must be one of: %s" % ", ".join(legal_namespace)
-            )
+        keep_namespace = self._validate_namespace(keep_namespace)
         self.annotations = self.annotations.loc[
             self.annotations.Aspect == keep_namespace, :
         ]
 
+    def get_as_csr(self) -> Tuple[List[str], List[str], np.array, np.array]:
+        """Returns annotations as CSR-style protein->term index arrays.
+
+        Returns
+        -------
+        proteins : List[str]
+            sorted protein ids (HUGO)
+        terms : List[str]
+            sorted GO ids of the annotated terms
+        indptr : np.array
+            protein i is annotated with terms[term_indices[indptr[i]:indptr[i + 1]]]
+        term_indices : np.array
+            term indices of all annotations, grouped by protein in file order
+        """
+        protein_codes, proteins = pd.factorize(
+            np.asarray(self.annotations.DB_Object_Symbol), sort=True
+        )
+        term_codes, terms = pd.factorize(np.asarray(self.annotations.GO_ID), sort=True)
+        order = np.argsort(protein_codes, kind="stable")
+        protein_sizes = np.bincount(protein_codes, minlength=len(proteins))
+        indptr = np.concatenate(([0], np.cumsum(protein_sizes)))
+        return list(proteins), list(terms), indptr, term_codes[order]
+
     def get_as_dict(self) -> Dict[str, List[str]]:
         """Returns annotations as protein->terms dict."""
-        return dict(self.annotations.groupby("DB_Object_Symbol")["GO_ID"].apply(list))
+        proteins, terms, indptr, term_indices = self.get_as_csr()
+        terms = np.array(terms, dtype=object)
+        return {
+            protein: terms[term_indices[indptr[i] : indptr[i + 1]]].tolist()
+            for i, protein in enumerate(proteins)
+        }
 
 
 class SpecificityCalculator:
     """Helper class to calculate frequency (specificity) of terms."""
 
     def __init__(
-        self, full_ancestry: Dict[str, List[str]], annotation_corpus: Type[Annotations]
+        self,
+        full_ancestry: Union[Dict[str, List[str]], AncestryIndex],
+        annotation_corpus: Type[Annotations],
     ) -> None:
-        """Inits with ancestry dictionary.
+        """Inits with ancestry dictionary or precomputed ancestry index.
 
         Parameters
         ----------
-        full_ancestry : Dict[str, List[str]]
-            Dictionary mapping term ids to ancestor ids (traced to root)
+        full_ancestry : Dict[str, List[str]] or AncestryIndex
+            Dictionary mapping term ids to ancestor ids (traced to root),
+            or the transitive closure of the GO graph
         annotation_corpus: onto.Annotations object
             Dictionary mapping terms to their counts in the anno corpus
         """
         self.full_ancestry = full_ancestry
         self.annotation_corpus = annotation_corpus
-        self._ancestry_matrix = self._get_matrix()
+        if isinstance(full_ancestry, AncestryIndex):
+            self.term_ids = full_ancestry.term_ids
+            self._ancestry_matrix = full_ancestry.matrix
+        else:
+            self.term_ids = sorted(list(full_ancestry))
+            self._ancestry_matrix = self._get_matrix()
 
     def _get_matrix(self) -> Type[sparse.coo_matrix]:
         """Returns sparse matrix representation of the ancestry dictionary.
@@ -341,14 +748,15 @@ class SpecificityCalculator:
         """
         index_a = []
         index_b = []
-        term_index = dict(
-            zip(sorted(list(self.full_ancestry)), range(len(self.full_ancestry)))
-        )
+        term_index = dict(zip(self.term_ids, range(len(self.term_ids))))
         for term, ancestors in self.full_ancestry.items():
             for ancestor_term in ancestors:
                 index_a.append(term_index[term])
                 index_b.append(term_index[ancestor_term])
-        ancestry_matrix = sparse.coo_matrix((np.ones(len(index_a)), (index_a, index_b)))
+        ancestry_matrix = sparse.coo_matrix(
+            (np.ones(len(index_a)), (index_a, index_b)),
+            shape=(len(self.term_ids), len(self.term_ids)),
+        )
         return ancestry_matrix
 
     def _encode_annotation_counts(self) -> np.array:
@@ -357,13 +765,8 @@ class SpecificityCalculator:
         For vector[i] = c, c is the number of times term i appears in the anno corpus.
         """
         term_counts = self.annotation_corpus.get_counts()
-        vector = []
-        for term in sorted(list(self.full_ancestry)):
-            if term in term_counts:
-                vector.append(term_counts[term])
-            else:
-                vector.append(0)
-        return np.array(vector).reshape(-1, 1)
+        vector = term_counts.reindex(self.term_ids, fill_value=0)
+        return vector.to_numpy(dtype=float)
 
     def get_full_count(self) -> np.array:
         """Count full number of times a term appears in the ontology.
@@ -384,10 +787,12 @@ class SpecificityCalculator:
         # That is what we do here.
         #
         # We count the number of times each term appears explicitly in the anno
-        # coprus, then multiply it by the flat ancestry matrix to create a matrix
-        # of complete/implied ancestry counts.
+        # coprus, then multiply it by the transposed ancestry matrix, which sums
+        # the counts of every term's descendants. Adding the explicit counts
+        # back in gives the complete count of each term.
         explicit_counts = self._encode_annotation_counts()
-        full_count = self._ancestry_matrix.multiply(explicit_counts).sum(axis=0)
+        implied_counts = self._ancestry_matrix.T @ explicit_counts
+        full_count = explicit_counts + implied_counts
         return full_count
 
     def get_specificity(self) -> Dict[str, float]:
@@ -399,9 +804,8 @@ class SpecificityCalculator:
             dictionary mapping terms to their negative log frequency (specificity)
         """
         full_count = self.get_full_count()
-        specificity = -1 * np.log10(full_count / full_count.sum())
-        specificity[specificity == np.Infinity] = 0  # terms with 0 annos
-        term_specificity = dict(
-            zip(sorted(list(self.full_ancestry)), specificity.tolist()[0])
-        )
+        with np.errstate(divide="ignore"):
+            specificity = -1 * np.log10(full_count / full_count.sum())
+        specificity[np.isinf(specificity)] = 0  # terms with 0 annos
+        term_specificity = dict(zip(self.term_ids, specificity.tolist()))
         return term_specificity
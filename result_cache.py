@@ -0,0 +1,175 @@
+"""
+Caches diffusion results, so that repeated submissions of the same
+kinase set are served without rerunning the diffusion.
+
+Typical usage example:
+
+    cache = ResultCache(max_size=256, ttl=3600)
+    key = get_result_key(network.get_version(), kinases, loo=False)
+    result = cache.get(key)
+    if result is None:
+        result = expensive_computation(kinases)
+        cache.set(key, result)
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Union
+
+
+def get_result_key(
+    network_version: str, proteins: List[str], loo: bool, *params: Any
+) -> str:
+    """Returns canonical cache key of a diffusion experiment.
+
+    Parameters
+    ----------
+    network_version : str
+        version of the network (see similarity.Network.get_version)
+    proteins : List[str]
+        input proteins; order and duplicates do not change the key
+    loo : bool
+        True for leave-one-out validation, False for plain diffusion
+    params : Any
+        any other JSON-serializable settings that change the result
+
+    Returns
+    -------
+    key : str
+        hex digest identifying the experiment
+    """
+    content = [network_version, sorted(set(proteins)), bool(loo), list(params)]
+    return hashlib.sha1(json.dumps(content).encode()).hexdigest()
+
+
+class ResultCache:
+    """LRU cache with size and time-to-live limits.
+
+    Results are kept in memory by default. If cache_dir is given, they are
+    pickled to that directory instead, so that all gunicorn workers on the
+    host share the same cache.
+
+    Attributes
+    ----------
+    max_size : int
+        max number of results held in the cache
+    ttl : float
+        seconds after which a result expires
+    cache_dir : str, None
+        directory of the on-disk backend, None to keep results in memory
+    hits : int
+        number of lookups served from the cache (by this process)
+    misses : int
+        number of lookups not found in the cache (by this process)
+    """
+
+    def __init__(
+        self,
+        max_size: int = 128,
+        ttl: float = 3600,
+        cache_dir: Union[str, None] = None,
+    ) -> None:
+        """Inits empty cache; see class docstring for parameters."""
+        self.max_size = max_size
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, key: str) -> Any:
+        """Returns cached result for the key, or None if absent or expired."""
+        if self.cache_dir is None:
+            result = self._get_from_memory(key)
+        else:
+            result = self._get_from_disk(key)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def set(self, key: str, result: Any) -> None:
+        """Stores a result, evicting the least recently used ones if full."""
+        if self.cache_dir is None:
+            self._results[key] = (time.time(), result)
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_size:
+                self._results.popitem(last=False)
+        else:
+            self._set_on_disk(key, result)
+
+    def get_stats(self) -> Dict[str, int]:
+        """Returns hit and miss counts of this process and the cache size."""
+        if self.cache_dir is None:
+            size = len(self._results)
+        else:
+            size = sum(name.endswith(".pkl") for name in os.listdir(self.cache_dir))
+        return {"hits": self.hits, "misses": self.misses, "size": size}
+
+    def _get_from_memory(self, key: str) -> Any:
+        """Looks up a result in the in-memory backend."""
+        if key not in self._results:
+            return None
+        created, result = self._results[key]
+        if time.time() - created > self.ttl:
+            del self._results[key]
+            return None
+        self._results.move_to_end(key)
+        return result
+
+    def _get_path(self, key: str) -> str:
+        """Returns file path of a result in the on-disk backend."""
+        return os.path.join(self.cache_dir, key + ".pkl")
+
+    def _get_from_disk(self, key: str) -> Any:
+        """Looks up a result in the on-disk backend."""
+        path = self._get_path(key)
+        try:
+            with open(path, "rb") as cache_file:
+                created, result = pickle.load(cache_file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None  # missing, or removed by another worker meanwhile
+        if time.time() - created > self.ttl:
+            self._remove(path)
+            return None
+        # file modification time tracks recency of use for LRU eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return result
+
+    def _set_on_disk(self, key: str, result: Any) -> None:
+        """Stores a result in the on-disk backend and evicts old ones."""
+        # write to a temporary file first, so that other workers never
+        # read a partially written result
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as cache_file:
+            pickle.dump((time.time(), result), cache_file)
+        os.replace(tmp_path, self._get_path(key))
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".pkl"):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    pass
+        entries.sort()
+        for _, path in entries[: max(len(entries) - self.max_size, 0)]:
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        """Removes a cache file, ignoring files already removed."""
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -4,14 +4,30 @@ produce a similarity matrix, which can then be converted into a
 protein-protein network for diffusion.
 """
 
+import csv
+import hashlib
+import json
+import os
 import pickle
-from typing import Dict, List, Union
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Dict, List, Tuple, Union
 
 import numpy as np
-import pandas as pd
 from scipy import sparse
 
-import onto
+if TYPE_CHECKING:
+    # pandas (through onto) is only needed to calculate similarity, so the
+    # app can load a Network without importing it
+    import pandas as pd
+
+    import onto
+
+# version of the on-disk network format written by Network.save
+NETWORK_SCHEMA_VERSION = 2
+
+# max number of scores held at once by Network.threshold_matrix
+THRESHOLD_BLOCK_ELEMENTS = 1 << 22
 
 
 class Calculator:
@@ -19,8 +35,8 @@ class Calculator:
 
     def __init__(
         self,
-        annotations: onto.Annotations,
-        ontology: onto.GoGraph,
+        annotations: "onto.Annotations",
+        ontology: "onto.GoGraph",
         proteins: List[str],
     ) -> None:
         """Inits with annotations, GO graph, and protein list.
@@ -34,7 +50,17 @@ class Calculator:
         proteins : List[str]
             list of proteins (HUGO ids) to build network for
         """
-        self.annotations = annotations.get_as_dict()
+        # CSR-style protein -> term index arrays (see Annotations.get_as_csr)
+        (
+            self.annotated_proteins,
+            self.annotated_terms,
+            self.annotation_indptr,
+            self.annotation_term_indices,
+        ) = annotations.get_as_csr()
+        self._protein_row = {
+            protein: row for row, protein in enumerate(self.annotated_proteins)
+        }
+        self.annotation_corpus = annotations
         self.ontology = ontology
         self.proteins = proteins
         self.protein_similarity = []
@@ -58,7 +84,7 @@ class Calculator:
         not_present = set(self.proteins) - set(present)
         # proteins with insufficient annotation count
         underannotated = [
-            p for p in self.proteins if len(self.annotations[p]) < min_annotations
+            p for p in present if self.get_annotation_count(p) < min_annotations
         ]
         # proteins to keep
         self.proteins = list(set(present) - set(underannotated))
@@ -73,25 +99,251 @@ class Calculator:
         present : List[str]
             subset of proteins in self.protein that is also found the annotation corpus
         """
-        present = list(set(self.annotations) & set(self.proteins))
+        present = list(set(self._protein_row) & set(self.proteins))
         return present
 
-    def calculate_similarity(self) -> None:
-        """Calculate similarity of all protein pairs in the set."""
+    def get_annotation_count(self, protein: str) -> int:
+        """Returns number of annotations of a protein in the corpus."""
+        row = self._protein_row[protein]
+        return int(self.annotation_indptr[row + 1] - self.annotation_indptr[row])
+
+    def get_protein_terms(self, protein: str) -> List[str]:
+        """Returns GO ids annotated to a protein, in annotation file order."""
+        row = self._protein_row[protein]
+        term_indices = self.annotation_term_indices[
+            self.annotation_indptr[row] : self.annotation_indptr[row + 1]
+        ]
+        return [self.annotated_terms[index] for index in term_indices]
+
+    def get_term_arrays(
+        self, proteins: List[str]
+    ) -> Tuple[List[str], np.array, np.array]:
+        """Slices the annotation arrays down to a list of proteins.
+
+        Parameters
+        ----------
+        proteins : List[str]
+            proteins (HUGO ids) present in the annotation corpus
+
+        Returns
+        -------
+        terms : List[str]
+            sorted GO ids of the terms annotated to the proteins
+        indptr : np.array
+            protein i is annotated with terms[term_indices[indptr[i]:indptr[i + 1]]]
+        term_indices : np.array
+            term indices of the proteins' annotations, in protein order
+        """
+        rows = np.array([self._protein_row[p] for p in proteins], dtype=np.int64)
+        starts = self.annotation_indptr[rows]
+        sizes = self.annotation_indptr[rows + 1] - starts
+        indptr = np.concatenate(([0], np.cumsum(sizes))).astype(np.int64)
+        # position of each selected annotation in the corpus arrays
+        positions = np.arange(indptr[-1]) + np.repeat(starts - indptr[:-1], sizes)
+        used_terms, term_indices = np.unique(
+            self.annotation_term_indices[positions], return_inverse=True
+        )
+        terms = [self.annotated_terms[index] for index in used_terms]
+        return terms, indptr, term_indices.astype(np.int64)
+
+    def calculate_similarity(self, vectorized: bool = True, n_jobs: int = 1) -> None:
+        """Calculate similarity of all protein pairs in the set.
+
+        Parameters
+        ----------
+        vectorized : bool, optional
+            if True, score all pairs at once with a TermSimilarityMatrix,
+            otherwise score pairs one by one with
+            calculate_similarity_two_proteins (reference implementation)
+        n_jobs : int, optional
+            number of worker processes for the vectorized calculation,
+            -1 to use all CPUs
+        """
         self.proteins = sorted(self.proteins)
-        protein_a_index = []
-        protein_b_index = []
-        similarity = []
-        for index_a, protein_a in enumerate(self.proteins):
-            for index_b, protein_b in enumerate(self.proteins):
-                if index_b >= index_a:
-                    sim = self.calculate_similarity_two_proteins(protein_a, protein_b)
-                    protein_a_index.append(index_a)
-                    protein_b_index.append(index_b)
-                    similarity.append(sim)
-        similarity = sparse.coo_matrix((similarity, (protein_a_index, protein_b_index)))
+        if vectorized:
+            terms, indptr, term_indices = self.get_term_arrays(self.proteins)
+            term_similarity = TermSimilarityMatrix(self.ontology, terms)
+            (
+                protein_a_index,
+                protein_b_index,
+                similarity,
+            ) = term_similarity.get_protein_similarity(indptr, term_indices, n_jobs)
+        else:
+            protein_a_index = []
+            protein_b_index = []
+            similarity = []
+            for index_a, protein_a in enumerate(self.proteins):
+                for index_b, protein_b in enumerate(self.proteins):
+                    if index_b >= index_a:
+                        sim = self.calculate_similarity_two_proteins(
+                            protein_a, protein_b
+                        )
+                        protein_a_index.append(index_a)
+                        protein_b_index.append(index_b)
+                        similarity.append(sim)
+        net_size = len(self.proteins)
+        similarity = sparse.coo_matrix(
+            (similarity, (protein_a_index, protein_b_index)),
+            shape=(net_size, net_size),
+        )
         self.protein_similarity = similarity
 
+    def update_similarity(
+        self,
+        previous: "Calculator",
+        max_changed_fraction: float = 0.5,
+        n_jobs: int = 1,
+    ) -> List[str]:
+        """Calculate similarity, reusing unchanged scores from a previous run.
+
+        Compares this calculator (new GO release) with the previous one and
+        rescores only the protein pairs whose score may have changed: pairs
+        with a protein that is new or whose term set changed, and pairs that
+        have a changed term pair (see _get_changed_term_pairs). Falls back
+        to a full rebuild if too many pairs changed.
+
+        Term specificity is log10(total count / term count), so a change in
+        the corpus size shifts every score by the same offset. Reused scores
+        get that offset added, so the result equals a full rebuild. Both
+        calculators must have the specificity calculated from their own
+        annotations assigned to their ontology.
+
+        Parameters
+        ----------
+        previous : Calculator
+            calculator of the previous run, with protein_similarity calculated
+        max_changed_fraction : float, optional
+            do a full rebuild if more than this fraction of pairs changed
+        n_jobs : int, optional
+            number of worker processes for a full rebuild, -1 to use all CPUs
+
+        Returns
+        -------
+        changed_proteins : List[str]
+            proteins with at least one recalculated pair
+        """
+        self.proteins = sorted(self.proteins)
+        net_size = len(self.proteins)
+        previous_index = {p: i for i, p in enumerate(previous.proteins)}
+        same_terms = np.array(
+            [
+                p in previous_index
+                and sorted(self.get_protein_terms(p))
+                == sorted(previous.get_protein_terms(p))
+                for p in self.proteins
+            ],
+            dtype=bool,
+        )
+        terms, indptr, term_indices = self.get_term_arrays(self.proteins)
+        is_changed_pair, offset = self._get_changed_term_pairs(previous, terms)
+        # protein x term incidence, to find protein pairs with a changed term pair
+        incidence = sparse.csr_matrix(
+            (np.ones(len(term_indices)), term_indices, indptr),
+            shape=(net_size, len(terms)),
+        )
+        is_affected = (incidence @ (incidence @ is_changed_pair).T) > 0
+        is_affected |= ~same_terms[:, None] | ~same_terms[None, :]
+        protein_a_index, protein_b_index = np.nonzero(np.triu(is_affected))
+        num_pairs = net_size * (net_size + 1) // 2
+        if len(protein_a_index) > max_changed_fraction * num_pairs:
+            self.calculate_similarity(n_jobs=n_jobs)
+            return list(self.proteins)
+        term_similarity = TermSimilarityMatrix(self.ontology, terms)
+        similarity = term_similarity.get_pair_similarity(
+            indptr, term_indices, protein_a_index, protein_b_index
+        )
+        # copy scores of unaffected pairs from the previous run
+        previous_similarity = sparse.coo_matrix(previous.protein_similarity)
+        previous_to_new = np.full(len(previous.proteins), -1, dtype=int)
+        for index, protein in enumerate(self.proteins):
+            if same_terms[index]:
+                previous_to_new[previous_index[protein]] = index
+        kept_rows = previous_to_new[previous_similarity.row]
+        kept_cols = previous_to_new[previous_similarity.col]
+        is_kept = (kept_rows >= 0) & (kept_cols >= 0)
+        is_kept[is_kept] = ~is_affected[kept_rows[is_kept], kept_cols[is_kept]]
+        kept_rows, kept_cols = kept_rows[is_kept], kept_cols[is_kept]
+        protein_a_index = np.concatenate(
+            (protein_a_index, np.minimum(kept_rows, kept_cols))
+        )
+        protein_b_index = np.concatenate(
+            (protein_b_index, np.maximum(kept_rows, kept_cols))
+        )
+        similarity = np.concatenate(
+            (similarity, previous_similarity.data[is_kept] + offset)
+        )
+        self.protein_similarity = sparse.coo_matrix(
+            (similarity, (protein_a_index, protein_b_index)),
+            shape=(net_size, net_size),
+        )
+        is_rescored = is_affected.any(axis=1)  # is_affected is symmetric
+        return [p for p, rescored in zip(self.proteins, is_rescored) if rescored]
+
+    def _get_changed_term_pairs(
+        self, previous: "Calculator", terms: List[str]
+    ) -> Tuple[np.array, float]:
+        """Finds term pairs whose similarity changed beyond a uniform offset.
+
+        The similarity of two terms is log10(total) - log10(count), where
+        count is the smallest annotation count among their common ancestors
+        (the MICA). It changes by exactly log10(total / previous total)
+        unless that count changed, which covers changes of both the term
+        counts and the ancestry.
+
+        Parameters
+        ----------
+        previous : Calculator
+            calculator of the previous run
+        terms : List[str]
+            sorted GO ids to compare
+
+        Returns
+        -------
+        is_changed_pair : np.array
+            len(terms) x len(terms) boolean matrix of changed term pairs
+        offset : float
+            similarity change of unchanged term pairs
+        """
+        counts = self.ontology.get_term_counts(self.annotation_corpus)
+        previous_counts = previous.ontology.get_term_counts(previous.annotation_corpus)
+        offset = np.log10(counts.sum() / previous_counts.sum())
+        ancestry = self.ontology.get_ancestry_index()
+        previous_ancestry = previous.ontology.get_ancestry_index()
+        is_common = np.array(
+            [term in previous_ancestry.term_index for term in terms], dtype=bool
+        )
+        common_terms = [term for term in terms if term in previous_ancestry.term_index]
+        # smallest common ancestor count of each term pair, as the MICA of a
+        # TermSimilarityMatrix on negated counts (0 if no common ancestor)
+        mica_count = TermSimilarityMatrix(self.ontology, common_terms, -counts)
+        previous_mica_count = TermSimilarityMatrix(
+            previous.ontology, common_terms, -previous_counts
+        )
+        # pairs without common ancestor score 0 instead of shifting
+        is_changed_common = (
+            (mica_count.matrix != previous_mica_count.matrix)
+            | (mica_count.matrix == 0)
+            | (previous_mica_count.matrix == 0)
+        )
+        is_changed_pair = np.ones((len(terms), len(terms)), dtype=bool)
+        is_changed_pair[np.ix_(is_common, is_common)] = is_changed_common
+        # the offset only holds if the assigned specificity fits the counts
+        index = np.array([ancestry.term_index[t] for t in common_terms], dtype=int)
+        previous_index = np.array(
+            [previous_ancestry.term_index[t] for t in common_terms], dtype=int
+        )
+        same_count = counts[index] == previous_counts[previous_index]
+        specificity_change = (
+            self.ontology.get_specificity_vector()[index]
+            - previous.ontology.get_specificity_vector()[previous_index]
+        )
+        if not np.allclose(specificity_change[same_count], offset):
+            raise ValueError(
+                "Term specificity does not match the annotation corpus; assign "
+                "the specificity calculated from the corpus to the ontology."
+            )
+        return is_changed_pair, offset
+
     def calculate_similarity_two_proteins(
         self, protein_a: str, protein_b: str
     ) -> float:
@@ -109,8 +361,8 @@ class Calculator:
         protein_similarity : float
             similarity score, higher is better
         """
-        terms_a = self.annotations[protein_a]
-        terms_b = self.annotations[protein_b]
+        terms_a = self.get_protein_terms(protein_a)
+        terms_b = self.get_protein_terms(protein_b)
         # run go terms through all-vs-all similarity test
         term_similarity = None
         term_sim_vec = []
@@ -123,7 +375,7 @@ class Calculator:
                     self._term_similarity[(a, b)] = term_similarity
                     self._term_similarity[(b, a)] = term_similarity
                 term_sim_vec.append(term_similarity)
-        term_sim_matrix = np.array(term_sim_vec).reshape(len(terms_b), len(terms_a))
+        term_sim_matrix = np.array(term_sim_vec).reshape(len(terms_a), len(terms_b))
         # do best match averaging of term similarity scores
         best_match_a = term_sim_matrix.max(axis=0)
         best_match_b = term_sim_matrix.max(axis=1)
@@ -152,21 +404,273 @@ class Calculator:
         if term1 == term2:
             return self.ontology.nodes[term1].specificity
 
-        ancestors1 = self.ontology.get_full_ancestry(term1)
-        ancestors2 = self.ontology.get_full_ancestry(term2)
-        shared_ancestors = list(set(ancestors1) & set(ancestors2))
+        ancestry = self.ontology.get_ancestry_index()
+        shared_ancestors = ancestry.get_common_ancestor_indices(term1, term2)
         if len(shared_ancestors) == 0:
             return 0
-        if len(shared_ancestors) == 1:
-            return self.ontology.nodes[shared_ancestors[0]].specificity
-        specificity_mica = 0
-        for ancestor in shared_ancestors:
-            specificity_mica = max(
-                specificity_mica, self.ontology.nodes[ancestor].specificity
-            )
+        specificity = self.ontology.get_specificity_vector()
+        specificity_mica = specificity[shared_ancestors].max()
         return specificity_mica
 
 
+class TermSimilarityMatrix:
+    """Helper class to score protein pairs with a precomputed term similarity matrix.
+
+    Attributes
+    ----------
+    terms : List[str]
+        sorted GO ids of the term universe
+    term_index : Dict[str, int]
+        mapping of GO ids to their row (column) in matrix
+    matrix : np.array
+        matrix[i, j] is the specificity of the most informative common
+        ancestor of terms i and j (see Calculator.get_term_similarity)
+    """
+
+    def __init__(
+        self,
+        ontology: "onto.GoGraph",
+        terms: List[str],
+        specificity: Union[np.array, None] = None,
+    ) -> None:
+        """Inits with GO graph and the terms to build the matrix for.
+
+        Parameters
+        ----------
+        ontology : onto.GoGraph
+            Gene Ontology term graph, with term specificity assigned
+        terms : List[str]
+            GO ids of the annotated terms (duplicates are fine); they are
+            sorted and deduplicated into self.terms, which the term indices
+            passed to get_protein_similarity refer to
+        specificity : np.array, optional
+            specificity of each term, ordered as the ontology's ancestry index;
+            defaults to the specificity assigned to the ontology
+        """
+        self.terms = sorted(set(terms))
+        self.term_index = {term: index for index, term in enumerate(self.terms)}
+        self.matrix = self._get_matrix(ontology, specificity)
+
+    def _get_matrix(
+        self, ontology: "onto.GoGraph", specificity: Union[np.array, None] = None
+    ) -> np.array:
+        """Builds the term x term MICA specificity matrix.
+
+        Returns
+        -------
+        matrix : np.array
+            matrix of term similarity scores
+        """
+        ancestry = ontology.get_ancestry_index()
+        if specificity is None:
+            specificity = ontology.get_specificity_vector()
+        # group terms by each of their ancestors
+        ancestor_members = {}
+        for index, term in enumerate(self.terms):
+            for ancestor in ancestry.get_ancestor_indices(term):
+                ancestor_members.setdefault(ancestor, []).append(index)
+        # Visit ancestors from least to most specific. Every term pair under
+        # an ancestor gets its specificity, so the last write for each pair
+        # is the specificity of the most informative common ancestor.
+        matrix = np.zeros((len(self.terms), len(self.terms)))
+        for ancestor in sorted(ancestor_members, key=lambda a: specificity[a]):
+            members = ancestor_members[ancestor]
+            matrix[np.ix_(members, members)] = specificity[ancestor]
+        # a term's similarity to itself is its own specificity
+        term_indices = [ancestry.term_index[term] for term in self.terms]
+        np.fill_diagonal(matrix, specificity[term_indices])
+        return matrix
+
+    def get_protein_similarity(
+        self,
+        indptr: np.array,
+        term_indices: np.array,
+        n_jobs: int = 1,
+        num_rows: Union[int, None] = None,
+    ) -> Tuple[np.array, np.array, np.array]:
+        """Calculates Resnik (BMA) similarity for all protein pairs.
+
+        With n_jobs > 1, the upper triangle is split into row blocks of
+        similar cost, and each block is scored in a worker process. The
+        workers memory-map the term matrix from a temporary .npy file, so
+        it is shared rather than pickled.
+
+        Parameters
+        ----------
+        indptr : np.array
+            protein i is annotated with terms[term_indices[indptr[i]:indptr[i + 1]]]
+        term_indices : np.array
+            indices into self.terms of all annotations, in protein order
+        n_jobs : int, optional
+            number of worker processes, -1 to use all CPUs
+        num_rows : int, optional
+            only score the first num_rows rows of the upper triangle, that is,
+            pairs that include one of the first num_rows proteins
+
+        Returns
+        -------
+        protein_a_index, protein_b_index, similarity : np.array
+            upper triangle (diagonal included) of the protein similarity
+            matrix in COO format
+        """
+        sizes = np.diff(indptr)
+        all_term_indices = np.asarray(term_indices, dtype=np.int64)
+        if num_rows is None:
+            num_rows = len(sizes)
+        if n_jobs == -1:
+            n_jobs = os.cpu_count()
+        if n_jobs <= 1:
+            blocks = [_get_bma_block(self.matrix, all_term_indices, sizes, 0, num_rows)]
+        else:
+            blocks = self._get_bma_blocks_parallel(
+                all_term_indices, sizes, n_jobs, num_rows
+            )
+        protein_a_index, protein_b_index, similarity = zip(*blocks)
+        return (
+            np.concatenate(protein_a_index),
+            np.concatenate(protein_b_index),
+            np.concatenate(similarity),
+        )
+
+    def get_pair_similarity(
+        self,
+        indptr: np.array,
+        term_indices: np.array,
+        protein_a_index: np.array,
+        protein_b_index: np.array,
+    ) -> np.array:
+        """Calculates Resnik (BMA) similarity for a list of protein pairs.
+
+        Parameters
+        ----------
+        indptr, term_indices : np.array
+            protein annotations, as for get_protein_similarity
+        protein_a_index, protein_b_index : np.array
+            proteins of each pair
+
+        Returns
+        -------
+        similarity : np.array
+            similarity of each pair, scored as by get_protein_similarity
+        """
+        protein_a_index = np.asarray(protein_a_index, dtype=np.int64)
+        protein_b_index = np.asarray(protein_b_index, dtype=np.int64)
+        term_indices = np.asarray(term_indices, dtype=np.int64)
+        sizes = np.diff(indptr)
+        similarity = np.zeros(len(protein_a_index))
+        for index_a in np.unique(protein_a_index):
+            pairs = np.flatnonzero(protein_a_index == index_a)
+            proteins_b = protein_b_index[pairs]
+            terms_a = term_indices[indptr[index_a] : indptr[index_a + 1]]
+            # terms of proteins b, concatenated
+            block_sizes = sizes[proteins_b]
+            block_offsets = np.concatenate(([0], np.cumsum(block_sizes)[:-1]))
+            positions = np.arange(block_sizes.sum()) + np.repeat(
+                indptr[proteins_b] - block_offsets, block_sizes
+            )
+            block = self.matrix[np.ix_(terms_a, term_indices[positions])]
+            best_match_a = np.maximum.reduceat(block, block_offsets, axis=1).sum(axis=0)
+            best_match_b = np.add.reduceat(block.max(axis=0), block_offsets)
+            similarity[pairs] = (best_match_a + best_match_b) / (
+                sizes[index_a] + block_sizes
+            )
+        return similarity
+
+    def _get_bma_blocks_parallel(
+        self, all_term_indices: np.array, sizes: np.array, n_jobs: int, num_rows: int
+    ) -> List[Tuple[np.array, np.array, np.array]]:
+        """Scores row blocks of the upper triangle in a process pool."""
+        # row a is scored against the terms of proteins a, a+1, ..., so
+        # balance blocks on that cost rather than on row count
+        row_cost = sizes * (sizes.sum() - np.concatenate(([0], np.cumsum(sizes)[:-1])))
+        row_cost = row_cost[:num_rows]
+        num_blocks = min(num_rows, n_jobs * 4)
+        block_edges = np.searchsorted(
+            np.cumsum(row_cost), np.linspace(0, row_cost.sum(), num_blocks + 1)[1:-1]
+        )
+        block_edges = np.unique(np.concatenate(([0], block_edges, [num_rows])))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            matrix_fp = os.path.join(tmp_dir, "term_similarity.npy")
+            np.save(matrix_fp, self.matrix)
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                futures = [
+                    executor.submit(
+                        _get_bma_block_from_file,
+                        matrix_fp,
+                        all_term_indices,
+                        sizes,
+                        row_start,
+                        row_stop,
+                    )
+                    for row_start, row_stop in zip(block_edges[:-1], block_edges[1:])
+                ]
+                blocks = [future.result() for future in futures]
+        return blocks
+
+
+def _get_bma_block(
+    matrix: np.array,
+    all_term_indices: np.array,
+    sizes: np.array,
+    row_start: int,
+    row_stop: int,
+) -> Tuple[np.array, np.array, np.array]:
+    """Scores protein rows [row_start, row_stop) of the upper triangle.
+
+    Parameters
+    ----------
+    matrix : np.array
+        term x term MICA specificity matrix
+    all_term_indices : np.array
+        term indices of all proteins, concatenated in protein order
+    sizes : np.array
+        number of terms of each protein
+    row_start, row_stop : int
+        range of proteins (rows) to score
+
+    Returns
+    -------
+    protein_a_index, protein_b_index, similarity : np.array
+        COO entries of the scored rows, for columns b >= a
+    """
+    offsets = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    net_size = len(sizes)
+    protein_a_index = []
+    protein_b_index = []
+    similarity = []
+    for index_a in range(row_start, row_stop):
+        terms_a = all_term_indices[offsets[index_a] : offsets[index_a] + sizes[index_a]]
+        # similarity of protein a terms vs terms of proteins a, a+1, ...
+        block = matrix[np.ix_(terms_a, all_term_indices[offsets[index_a] :])]
+        block_offsets = offsets[index_a:] - offsets[index_a]
+        best_match_a = np.maximum.reduceat(block, block_offsets, axis=1).sum(axis=0)
+        best_match_b = np.add.reduceat(block.max(axis=0), block_offsets)
+        similarity.append(
+            (best_match_a + best_match_b) / (sizes[index_a] + sizes[index_a:])
+        )
+        protein_a_index.append(np.full(net_size - index_a, index_a))
+        protein_b_index.append(np.arange(index_a, net_size))
+    if not similarity:
+        return np.array([], dtype=int), np.array([], dtype=int), np.array([])
+    return (
+        np.concatenate(protein_a_index),
+        np.concatenate(protein_b_index),
+        np.concatenate(similarity),
+    )
+
+
+def _get_bma_block_from_file(
+    matrix_fp: str,
+    all_term_indices: np.array,
+    sizes: np.array,
+    row_start: int,
+    row_stop: int,
+) -> Tuple[np.array, np.array, np.array]:
+    """Process pool entry point; memory-maps the term matrix and scores rows."""
+    matrix = np.load(matrix_fp, mmap_mode="r")
+    return _get_bma_block(matrix, all_term_indices, sizes, row_start, row_stop)
+
+
 class Network:
     """Similairity matrix and its protein ids."""
 
@@ -185,11 +689,53 @@ class Network:
             List of proteins in the matrix, so that proteins[i] corresponds to
             row (column) i in protein_similarity matrix
         """
+        protein_similarity = sparse.csr_matrix(protein_similarity)
         self.protein_similarity = protein_similarity + protein_similarity.T
-        self.protein_similarity = self.protein_similarity.todense()
-        np.fill_diagonal(self.protein_similarity, 0)
+        self.protein_similarity.setdiag(0)
+        self.protein_similarity.eliminate_zeros()
         self.proteins = proteins
         self.network = None
+        self.index_proteins()
+
+    def index_proteins(self) -> None:
+        """Builds the name -> index lookup of the network proteins."""
+        self.protein_index = {
+            protein.upper(): index for index, protein in enumerate(self.proteins)
+        }
+        self._protein_names = np.array(self.proteins, dtype=object)
+
+    def add_aliases(self, aliases: Dict[str, str]) -> None:
+        """Lets proteins also be looked up by other ids.
+
+        Lookups are case-insensitive. An alias never overrides the name of
+        a network protein or an alias added earlier.
+
+        Parameters
+        ----------
+        aliases : Dict[str, str]
+            maps alternative ids (ex: UniProt accessions) to protein names;
+            entries for proteins not in the network are skipped
+        """
+        for alias, protein in aliases.items():
+            alias = alias.upper()
+            protein_index = self.protein_index.get(protein.upper())
+            if protein_index is not None and alias not in self.protein_index:
+                self.protein_index[alias] = protein_index
+
+    def load_aliases(self, kinase_fp: str = "data/list_of_human_kinases.csv") -> None:
+        """Adds UniProt accessions and gene synonyms from the kinase list.
+
+        Parameters
+        ----------
+        kinase_fp : str, optional
+            CSV file with gene_symbol, gene_synonym and uniprot columns
+        """
+        with open(kinase_fp, newline="") as kinase_file:
+            kinases = [row for row in csv.DictReader(kinase_file) if row["gene_symbol"]]
+        for column in ["gene_synonym", "uniprot"]:
+            self.add_aliases(
+                {row[column]: row["gene_symbol"] for row in kinases if row[column]}
+            )
 
     def get_protein_name_by_index(self, protein_index: int) -> str:
         """Get protein name given its position (index) in network matrix.
@@ -225,12 +771,57 @@ class Network:
         ValueError
             if protein name not found in network
         """
-        if protein_name not in self.proteins:
+        protein_index = self.protein_index.get(protein_name.upper())
+        if protein_index is None:
             raise ValueError("Protein %s not found in network." % protein_name)
-        protein_index = self.proteins.index(protein_name.upper())
         return protein_index
 
-    def get_similarity_vector_for_protein(self, protein_name: str) -> pd.DataFrame:
+    def indices_for(self, protein_names: List[str]) -> np.array:
+        """Gets indices (positions) in network matrix of several proteins.
+
+        Parameters
+        ----------
+        protein_names : List[str]
+            protein names or their aliases (see add_aliases)
+
+        Returns
+        -------
+        protein_indices : np.array
+            index of each protein in the network
+
+        Raises
+        ------
+        ValueError
+            if any protein name is not found in network
+        """
+        lookup = self.protein_index
+        protein_indices = [lookup.get(name.upper(), -1) for name in protein_names]
+        protein_indices = np.array(protein_indices, dtype=np.int64)
+        if (protein_indices < 0).any():
+            missing = [name for name, i in zip(protein_names, protein_indices) if i < 0]
+            raise ValueError("Proteins not found in network: %s" % ", ".join(missing))
+        return protein_indices
+
+    def names_for(self, protein_indices: np.array) -> List[str]:
+        """Gets names of proteins at several indices (positions) in network matrix.
+
+        Parameters
+        ----------
+        protein_indices : np.array
+            indices of proteins in the network
+
+        Returns
+        -------
+        protein_names : List[str]
+            name of each protein
+        """
+        return self._protein_names[np.asarray(protein_indices, dtype=np.int64)].tolist()
+
+    def has_protein(self, protein_name: str) -> bool:
+        """Checks if a protein name (or alias) is in the network."""
+        return protein_name.upper() in self.protein_index
+
+    def get_similarity_vector_for_protein(self, protein_name: str) -> "pd.DataFrame":
         """Given a protein return it's similarity to other proteins in network.
 
         Parameters
@@ -244,50 +835,80 @@ class Network:
             pandas df mapping similarity of query protein to other
             proteins in network
         """
+        import pandas as pd
+
         protein_index = self.get_protein_index(protein_name)
-        similarity_scores = self.protein_similarity[protein_index, :].tolist()[0]
+        similarity_scores = self.protein_similarity[protein_index, :].toarray()[0]
         similarity_vector = pd.DataFrame(
             {"protein": self.proteins, "similarity_score": similarity_scores}
         )
         return similarity_vector
 
-    def threshold_matrix(self, n: Union[int, None] = None) -> None:
+    def threshold_matrix(
+        self, n: Union[int, None] = None, keep_ties: bool = False
+    ) -> None:
         """Drops low-similarity edges to create network.
 
         For each protein, sets its n most similar connections to 1,
-        and sets all others to 0.
+        and sets all others to 0. Rows are processed in blocks straight
+        from the sparse similarity data, so the dense matrix is never built.
 
         Parameters
         ----------
         n : int, optional
             Number of edges to keep for each protein,
             sqrt(network_size) by default. Default: sqrt of the network size.
+        keep_ties : bool, optional
+            if True, also keep every edge tied with the n-th best one, so
+            a protein may get more than n edges. By default, ties are
+            broken in favor of the protein with the lower index.
 
         Returns
         -------
-        network : scipy.sparse.coo_matrix
+        network : scipy.sparse.csr_matrix
             An adjacency matrix of 1s and 0s, where 1
             denotes a connection between two proteins.
         """
         if n is None:
             n = np.ceil(np.sqrt(len(self.proteins)))
         n = int(n)  # keep this line! if n is a float, numpy throws an error
-        adj_matrix = self.protein_similarity.copy()
-        net_size = len(self.proteins)
-        top_n_edge_cutoff = np.partition(adj_matrix, net_size - n, axis=1)[
-            :, net_size - n
-        ]
-        mask_top_n_edge = adj_matrix >= top_n_edge_cutoff
-        adj_matrix[mask_top_n_edge] = 1
-        adj_matrix[~mask_top_n_edge] = 0
+        similarity = self.protein_similarity
+        row_sizes = np.diff(similarity.indptr)
+        max_row_size = max(int(row_sizes.max(initial=0)), 1)
+        block_size = max(THRESHOLD_BLOCK_ELEMENTS // max_row_size, 1)
+        kept_columns = []
+        for row_start in range(0, len(self.proteins), block_size):
+            row_stop = min(row_start + block_size, len(self.proteins))
+            kept_columns.append(
+                _get_top_n_block(similarity, row_start, row_stop, n, keep_ties)
+            )
+        kept_per_row = np.concatenate([rows for rows, _ in kept_columns])
+        indices = np.concatenate([columns for _, columns in kept_columns])
+        indptr = np.concatenate(([0], np.cumsum(kept_per_row)))
+        adj_matrix = sparse.csr_matrix(
+            (np.ones(len(indices)), indices, indptr), shape=similarity.shape
+        )
         self.network = adj_matrix
 
-    def enforce_network_symmetry(self) -> None:
-        """Updates the adjacency matrix to be symmetric about the diagonal."""
+    def enforce_network_symmetry(self, rule: str = "union") -> None:
+        """Updates the adjacency matrix to be symmetric about the diagonal.
+
+        Parameters
+        ----------
+        rule : str, optional
+            "union" keeps an edge if either protein selected the other,
+            "mutual" keeps it only if both proteins selected each other
+        """
         if self.network is None:
             raise ValueError("Network is None. Did you threshold the matrix?")
-        symmetric_network = self.network + self.network.T
-        symmetric_network[symmetric_network > 0] = 1
+        if rule == "union":
+            symmetric_network = (self.network + self.network.T).tocsr()
+        elif rule == "mutual":
+            symmetric_network = self.network.multiply(self.network.T).tocsr()
+        else:
+            raise ValueError("Symmetry rule must be one of: union, mutual")
+        symmetric_network.eliminate_zeros()
+        symmetric_network.data[:] = 1
         self.network = symmetric_network
 
     def get_edges_for_protein(self, protein: str) -> List[str]:
@@ -306,10 +927,22 @@ class Network:
         if self.network is None:
             raise ValueError("Network is None. Did you threshold the matrix?")
         protein_index = self.get_protein_index(protein)
-        edge_indices = self.network[protein_index, :].nonzero()[1].tolist()
-        edge_names = [self.get_protein_name_by_index(i) for i in edge_indices]
+        network = self.network
+        edge_indices = network.indices[
+            network.indptr[protein_index] : network.indptr[protein_index + 1]
+        ]
+        edge_names = self.names_for(edge_indices)
         return edge_names
 
+    def get_version(self) -> str:
+        """Returns a hash that changes whenever the proteins or edges change."""
+        if self.network is None:
+            raise ValueError("Network is None. Did you threshold the matrix?")
+        version = hashlib.sha1(json.dumps(self.proteins).encode())
+        version.update(self.network.indptr.astype(np.int64).tobytes())
+        version.update(self.network.indices.astype(np.int64).tobytes())
+        return version.hexdigest()[:16]
+
     def save_as_pickle(self, save_path: str) -> None:
         """Pickles self to a given file path.
 
@@ -319,3 +952,155 @@ class Network:
             file path to dump the pickle
         """
         pickle.dump(self, open(save_path, "wb"))
+
+    def save(self, save_dir: str) -> None:
+        """Saves network as versioned CSR .npy arrays plus a JSON protein index.
+
+        If the matrix has not been thresholded yet, only the similarity
+        matrix is saved.
+
+        Parameters
+        ----------
+        save_dir : str
+            directory to write the network files to
+        """
+        os.makedirs(save_dir, exist_ok=True)
+        _save_csr(save_dir, "protein_similarity", self.protein_similarity)
+        if self.network is not None:
+            _save_csr(save_dir, "network", self.network)
+        meta = {
+            "schema_version": NETWORK_SCHEMA_VERSION,
+            "proteins": list(self.proteins),
+            "has_network": self.network is not None,
+        }
+        with open(os.path.join(save_dir, "meta.json"), "w") as meta_file:
+            json.dump(meta, meta_file)
+
+    @classmethod
+    def load(cls, load_dir: str, mmap: bool = True) -> "Network":
+        """Loads network written by Network.save.
+
+        Parameters
+        ----------
+        load_dir : str
+            directory holding the network files
+        mmap : bool, optional
+            if True, memory-map the arrays read-only, so that processes
+            loading the same network share its pages
+
+        Returns
+        -------
+        network : Network
+            network with its similarity matrix and CSR adjacency matrix
+            (None if the network was saved before thresholding)
+
+        Raises
+        ------
+        ValueError
+            if the files were written with a different schema version
+        """
+        with open(os.path.join(load_dir, "meta.json")) as meta_file:
+            meta = json.load(meta_file)
+        if meta.get("schema_version") != NETWORK_SCHEMA_VERSION:
+            raise ValueError(
+                "Network in %s has schema version %s, expected %d."
+                % (load_dir, meta.get("schema_version"), NETWORK_SCHEMA_VERSION)
+            )
+        mmap_mode = "r" if mmap else None
+        proteins = meta["proteins"]
+        shape = (len(proteins), len(proteins))
+        network = cls.__new__(cls)
+        network.proteins = proteins
+        network.index_proteins()
+        network.protein_similarity = _load_csr(
+            load_dir, "protein_similarity", shape, mmap_mode
+        )
+        network.network = None
+        if meta.get("has_network", True):
+            network.network = _load_csr(load_dir, "network", shape, mmap_mode)
+        return network
+
+
+def _get_top_n_block(
+    similarity: sparse.csr_matrix,
+    row_start: int,
+    row_stop: int,
+    n: int,
+    keep_ties: bool,
+) -> Tuple[np.array, np.array]:
+    """Selects the n highest-scoring columns of each row in a block of rows.
+
+    Parameters
+    ----------
+    similarity : sparse.csr_matrix
+        protein similarity matrix
+    row_start, row_stop : int
+        block of rows to process
+    n : int
+        number of columns to keep per row
+    keep_ties : bool
+        keep all columns tied with the n-th best, instead of the ones
+        with the lowest column index
+
+    Returns
+    -------
+    kept_per_row : np.array
+        number of kept columns for each row in the block
+    kept_columns : np.array
+        kept column indices, row by row in ascending column order
+    """
+    start, stop = similarity.indptr[row_start], similarity.indptr[row_stop]
+    scores = np.asarray(similarity.data[start:stop], dtype=float)
+    columns = np.asarray(similarity.indices[start:stop])
+    row_sizes = np.diff(similarity.indptr[row_start : row_stop + 1])
+    rows = np.repeat(np.arange(row_stop - row_start), row_sizes)
+    width = int(row_sizes.max(initial=0))
+    if width <= n:
+        keep = np.ones(len(scores), dtype=bool)
+    else:
+        # pad rows to equal length, then find each row's n-th best score
+        positions = np.arange(len(scores)) - np.repeat(
+            similarity.indptr[row_start:row_stop] - start, row_sizes
+        )
+        padded = np.full((row_stop - row_start, width), -np.inf)
+        padded[rows, positions] = scores
+        kth = np.argpartition(padded, width - n, axis=1)[:, width - n]
+        cutoff = padded[np.arange(len(padded)), kth][rows]
+        keep = scores > cutoff
+        tied = scores == cutoff
+        if keep_ties:
+            keep |= tied
+        else:
+            # fill the remaining slots of each row with its lowest-index ties
+            open_slots = n - np.bincount(rows[keep], minlength=len(padded))
+            tied_positions = np.flatnonzero(tied)
+            tied_positions = tied_positions[
+                np.lexsort((columns[tied_positions], rows[tied_positions]))
+            ]
+            tied_rows = rows[tied_positions]
+            first_tie = np.searchsorted(tied_rows, tied_rows)
+            tie_rank = np.arange(len(tied_rows)) - first_tie
+            keep[tied_positions[tie_rank < open_slots[tied_rows]]] = True
+    order = np.lexsort((columns[keep], rows[keep]))
+    kept_per_row = np.bincount(rows[keep], minlength=row_stop - row_start)
+    return kept_per_row, columns[keep][order]
+
+
+def _save_csr(save_dir: str, name: str, matrix: sparse.spmatrix) -> None:
+    """Saves sparse matrix as name_data/name_indices/name_indptr .npy files."""
+    matrix = sparse.csr_matrix(matrix)
+    for part in ["data", "indices", "indptr"]:
+        np.save(
+            os.path.join(save_dir, "%s_%s.npy" % (name, part)), getattr(matrix, part)
+        )
+
+
+def _load_csr(
+    load_dir: str, name: str, shape: tuple, mmap_mode: Union[str, None]
+) -> sparse.csr_matrix:
+    """Loads sparse matrix saved by _save_csr."""
+    data, indices, indptr = [
+        np.load(os.path.join(load_dir, "%s_%s.npy" % (name, part)), mmap_mode=mmap_mode)
+        for part in ["data", "indices", "indptr"]
+    ]
+    return sparse.csr_matrix((data, indices, indptr), shape=shape)
@@ -0,0 +1,117 @@
+"""Sweeps network hyperparameters and scores each network by LOO AUC.
+
+Usage:
+
+    table = sweep(
+        similarity_networks={"P": network},
+        benchmark_sets={"p53": p53_kinases},
+        edges=[1, 3, 5, 10],
+        rules=["union", "mutual"],
+        n_jobs=4,
+    )
+    print(table.pivot_table(index="edges", columns=["namespace", "rule"], values="auc"))
+"""
+
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+import cross_validation
+import diffusion
+import similarity
+
+
+def sweep(
+    similarity_networks: Dict[str, similarity.Network],
+    benchmark_sets: Dict[str, List[str]],
+    edges: List[int],
+    rules: List[str],
+    n_jobs: int = 1,
+) -> pd.DataFrame:
+    """Scores every (namespace, edges, symmetry rule) network on benchmark sets.
+
+    Each similarity matrix is written once to a temporary directory, and
+    worker processes memory-map it instead of receiving a pickled copy.
+
+    Parameters
+    ----------
+    similarity_networks : Dict[str, similarity.Network]
+        similarity matrix container for each namespace (C, P, or F)
+    benchmark_sets : Dict[str, List[str]]
+        named sets of proteins that should cluster in a good network
+    edges : List[int]
+        numbers of edges to keep per protein (see Network.threshold_matrix)
+    rules : List[str]
+        symmetry rules (see Network.enforce_network_symmetry)
+    n_jobs : int, optional
+        number of worker processes, -1 to use all CPUs
+
+    Returns
+    -------
+    auc_table : pd.DataFrame
+        one row per namespace, edges, rule and benchmark set, with LOO AUC
+    """
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        network_dirs = {}
+        for namespace, network in similarity_networks.items():
+            network_dirs[namespace] = os.path.join(tmp_dir, namespace)
+            network.save(network_dirs[namespace])
+        configs = [
+            (network_dirs[namespace], namespace, n, rule, benchmark_sets)
+            for namespace, n, rule in product(network_dirs, edges, rules)
+        ]
+        if n_jobs <= 1:
+            results = [_evaluate_network(*config) for config in configs]
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                futures = [executor.submit(_evaluate_network, *c) for c in configs]
+                results = [future.result() for future in futures]
+    auc_table = pd.DataFrame(
+        [row for rows in results for row in rows],
+        columns=["namespace", "edges", "rule", "benchmark_set", "auc"],
+    )
+    return auc_table
+
+
+def _evaluate_network(
+    network_dir: str,
+    namespace: str,
+    n: int,
+    rule: str,
+    benchmark_sets: Dict[str, List[str]],
+) -> List[tuple]:
+    """Builds one network from a saved similarity matrix and scores it.
+
+    Returns
+    -------
+    rows : List[tuple]
+        (namespace, edges, rule, benchmark set, auc) for each benchmark set
+        with at least two proteins in the network; auc is NaN if the
+        network has no edges
+    """
+    network = similarity.Network.load(network_dir)
+    network.threshold_matrix(n=n)
+    network.enforce_network_symmetry(rule=rule)
+    try:
+        operator = diffusion.DiffusionOperator(network)
+    except ValueError:
+        operator = None  # no edges left (ex: "mutual" with few edges)
+    rows = []
+    for set_name, proteins in benchmark_sets.items():
+        proteins = [p for p in proteins if network.has_protein(p)]
+        if len(proteins) < 2:
+            continue
+        if operator is None:
+            rows.append((namespace, n, rule, set_name, np.nan))
+            continue
+        loo = cross_validation.LOOValitation(network, proteins, operator)
+        loo.run_validation()
+        rows.append((namespace, n, rule, set_name, loo.get_roc()[2]))
+    return rows
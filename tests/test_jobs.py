@@ -0,0 +1,99 @@
+"""Tests for the background job queue (jobs.JobQueue)."""
+
+import os
+import time
+import uuid
+
+import pytest
+
+from jobs import DONE, FAILED, RUNNING, UNKNOWN, JobQueue
+
+
+def record_call(call_dir, seconds=0.0):
+    """Job that leaves one file per run in call_dir."""
+    open(os.path.join(call_dir, uuid.uuid4().hex), "w").close()
+    time.sleep(seconds)
+    return 42
+
+
+def fail():
+    raise ValueError("bad input")
+
+
+def wait_for(queue, job_id, timeout=10):
+    t0 = time.time()
+    while time.time() - t0 < timeout:
+        status, _ = queue.get_status(job_id)
+        if status != RUNNING:
+            return status
+        time.sleep(0.05)
+    raise AssertionError("job %s did not finish" % job_id)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_queue(request, tmp_path):
+    queues = []
+
+    def make_queue(**kwargs):
+        db_fp = None if request.param == "memory" else str(tmp_path / "jobs.sqlite")
+        queue = JobQueue(max_workers=2, db_fp=db_fp, **kwargs)
+        queues.append(queue)
+        return queue
+
+    yield make_queue
+    for queue in queues:
+        if queue._executor is not None:
+            queue._executor.shutdown()
+
+
+def test_submit_deduplicates_jobs(make_queue, tmp_path):
+    queue = make_queue()
+    assert queue.get_status("job")[0] == UNKNOWN
+    queue.submit("job", record_call, str(tmp_path), 0.3)
+    queue.submit("job", record_call, str(tmp_path), 0.3)
+    assert queue.get_status("job")[0] == RUNNING
+    assert wait_for(queue, "job") == DONE
+    queue.submit("job", record_call, str(tmp_path))  # done jobs are kept too
+    assert queue.get_result("job") == 42
+    assert len([f for f in os.listdir(str(tmp_path)) if f != "jobs.sqlite"]) == 1
+
+
+def test_failed_job_reports_its_error(make_queue):
+    queue = make_queue()
+    queue.submit("job", fail)
+    assert wait_for(queue, "job") == FAILED
+    with pytest.raises(RuntimeError, match="bad input"):
+        queue.get_result("job")
+
+
+def test_finished_jobs_expire(make_queue, tmp_path):
+    queue = make_queue(ttl=0.2)
+    queue.submit("job", record_call, str(tmp_path))
+    assert wait_for(queue, "job") == DONE
+    time.sleep(0.3)
+    queue.submit("other job", record_call, str(tmp_path))  # cleans up
+    assert queue.get_status("job")[0] == UNKNOWN
+
+
+def test_lost_job_times_out_and_can_be_resubmitted(tmp_path):
+    db_fp = str(tmp_path / "jobs.sqlite")
+    queue = JobQueue(max_workers=1, db_fp=db_fp, timeout=0.2)
+    queue.submit("job", record_call, str(tmp_path), 1.0)
+    time.sleep(0.3)
+    assert queue.get_status("job")[0] == FAILED
+    queue.submit("job", record_call, str(tmp_path))
+    assert queue.get_status("job")[0] == RUNNING
+    queue._executor.shutdown()
+
+
+def test_sqlite_queue_is_shared_between_workers(tmp_path):
+    db_fp = str(tmp_path / "jobs.sqlite")
+    submitting_worker = JobQueue(max_workers=1, db_fp=db_fp)
+    polling_worker = JobQueue(max_workers=1, db_fp=db_fp)
+    submitting_worker.submit("job", record_call, str(tmp_path), 0.3)
+    polling_worker.submit("job", record_call, str(tmp_path), 0.3)
+    assert polling_worker._executor is None  # deduplicated, nothing started
+    assert wait_for(polling_worker, "job") == DONE
+    assert polling_worker.get_result("job") == 42
+    assert len([f for f in os.listdir(str(tmp_path)) if f != "jobs.sqlite"]) == 1
+    submitting_worker._executor.shutdown()
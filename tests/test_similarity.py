@@ -0,0 +1,124 @@
+"""Tests for the incremental similarity rebuild (Calculator.update_similarity)."""
+
+import numpy as np
+import pytest
+
+import onto
+import similarity
+
+# small BP tree: R -> A -> A1, A2 and R -> B -> B1, B2, B3
+TERMS = {
+    "GO:0000001": [],
+    "GO:0000002": ["GO:0000001"],
+    "GO:0000003": ["GO:0000002"],
+    "GO:0000004": ["GO:0000002"],
+    "GO:0000005": ["GO:0000001"],
+    "GO:0000006": ["GO:0000005"],
+    "GO:0000007": ["GO:0000005"],
+    "GO:0000008": ["GO:0000005"],
+}
+
+ANNOTATIONS = {
+    "P1": ["GO:0000003", "GO:0000004"],
+    "P2": ["GO:0000003", "GO:0000004"],
+    "P3": ["GO:0000006", "GO:0000007"],
+    "P4": ["GO:0000007", "GO:0000008"],
+    "P5": ["GO:0000006", "GO:0000008", "GO:0000008"],
+    "P6": ["GO:0000003", "GO:0000008"],
+}
+
+
+def write_obo(path):
+    with open(path, "w") as obo_file:
+        obo_file.write("format-version: 1.2\n\n")
+        for term, parents in TERMS.items():
+            obo_file.write("[Term]\nid: %s\nname: %s\n" % (term, term))
+            obo_file.write("namespace: biological_process\n")
+            for parent in parents:
+                obo_file.write("is_a: %s ! parent\n" % parent)
+            obo_file.write("\n")
+
+
+def write_gaf(path, annotations):
+    with open(path, "w") as gaf_file:
+        gaf_file.write("!gaf-version: 2.2\n")
+        for protein, terms in annotations.items():
+            for term in terms:
+                row = ["UniProtKB", protein, protein, "", term, "REF", "EXP"]
+                row += ["", "P", "", "", "protein", "taxon:9606", "20200101"]
+                row += ["GOC", "", ""]
+                gaf_file.write("\t".join(row) + "\n")
+
+
+def get_calculator(tmp_path, name, annotations):
+    obo_fp = str(tmp_path / "go.obo")
+    write_obo(obo_fp)
+    gaf_fp = str(tmp_path / ("%s.gaf" % name))
+    write_gaf(gaf_fp, annotations)
+    ontology = onto.GoGraph(obo_fp)
+    ontology.parse_ontology()
+    corpus = onto.Annotations(gaf_fp, keep_namespace="P")
+    ontology.assign_term_specificity(ontology.calculate_term_specificity(corpus))
+    return similarity.Calculator(corpus, ontology, list(annotations))
+
+
+@pytest.mark.parametrize(
+    "previous_annotations",
+    [
+        # one protein lost an annotation
+        dict(ANNOTATIONS, P2=["GO:0000003"]),
+        # one protein is new
+        {p: t for p, t in ANNOTATIONS.items() if p != "P6"},
+        # one protein swapped a term
+        dict(ANNOTATIONS, P4=["GO:0000006", "GO:0000008"]),
+        # nothing changed
+        ANNOTATIONS,
+    ],
+)
+def test_update_similarity_equals_full_rebuild(tmp_path, previous_annotations):
+    previous = get_calculator(tmp_path, "previous", previous_annotations)
+    previous.calculate_similarity()
+    updated = get_calculator(tmp_path, "new", ANNOTATIONS)
+    changed_proteins = updated.update_similarity(previous, max_changed_fraction=1.0)
+    rebuilt = get_calculator(tmp_path, "new", ANNOTATIONS)
+    rebuilt.calculate_similarity()
+    assert updated.proteins == rebuilt.proteins
+    np.testing.assert_allclose(
+        updated.protein_similarity.toarray(),
+        rebuilt.protein_similarity.toarray(),
+        rtol=0,
+        atol=1e-12,
+    )
+    if previous_annotations is ANNOTATIONS:
+        assert changed_proteins == []
+    else:
+        assert len(changed_proteins) > 0
+
+
+def test_update_similarity_reuses_unaffected_pairs(tmp_path):
+    previous = get_calculator(
+        tmp_path, "previous", dict(ANNOTATIONS, P2=["GO:0000003"])
+    )
+    previous.calculate_similarity()
+    updated = get_calculator(tmp_path, "new", ANNOTATIONS)
+    terms, _, _ = updated.get_term_arrays(sorted(updated.proteins))
+    is_changed_pair, offset = updated._get_changed_term_pairs(previous, terms)
+    assert offset != 0
+    # the B branch gained no annotations, so its term pairs only shift
+    index = {term: i for i, term in enumerate(terms)}
+    b_terms = [index[t] for t in ["GO:0000006", "GO:0000007", "GO:0000008"]]
+    assert not is_changed_pair[np.ix_(b_terms, b_terms)].any()
+    assert is_changed_pair[index["GO:0000004"], index["GO:0000004"]]
+
+
+def test_update_similarity_rejects_mismatched_specificity(tmp_path):
+    previous = get_calculator(
+        tmp_path, "previous", dict(ANNOTATIONS, P2=["GO:0000003"])
+    )
+    previous.calculate_similarity()
+    updated = get_calculator(tmp_path, "new", ANNOTATIONS)
+    updated.ontology.assign_term_specificity(
+        {term: 1.0 for term in updated.ontology.nodes}
+    )
+    with pytest.raises(ValueError):
+        updated.update_similarity(previous, max_changed_fraction=1.0)